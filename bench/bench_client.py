@@ -0,0 +1,43 @@
+"""
+Compares a fresh connection per call (requests.request) against the pooled AdoClient session
+
+    python -m bench.bench_client [calls]
+"""
+import sys
+import time
+
+import requests
+
+from bench.mock_ado import MockAdoServer
+from src.azureapi import AdoClient, APPLICATION_JSON_HEADERS, DEFAULT_ADO_PARAMS
+
+
+def run_unpooled(server: MockAdoServer, calls: int):
+    url = f"{server.base_url}/org/project/_apis/wit/workitems/1"
+    for _ in range(calls):
+        resp = requests.request("GET", url, headers=APPLICATION_JSON_HEADERS, params=DEFAULT_ADO_PARAMS,
+                                auth=("", "token"))
+        resp.raise_for_status()
+
+
+def run_pooled(server: MockAdoServer, calls: int):
+    # Unpaced like requests.request so only connection reuse is compared
+    client = AdoClient(organization="org", project_name="project", token="token", base_url=server.base_url,
+                       max_request_rate=None)
+    for _ in range(calls):
+        client.get_work_item(client.work_item_url(1))
+
+
+def main(calls: int = 200):
+    with MockAdoServer() as server:
+        for name, func in [("requests.request", run_unpooled), ("AdoClient", run_pooled)]:
+            server.reset_counters()
+            start = time.perf_counter()
+            func(server, calls)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<18} calls={calls:<5} connections={server.connections:<5} "
+                  f"wall={elapsed * 1000:8.1f}ms per_call={elapsed / calls * 1000:6.2f}ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
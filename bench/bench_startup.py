@@ -0,0 +1,96 @@
+"""
+Startup cost of each `ado` subcommand against the local mock server
+
+Reports the median wall clock time over several runs and the total import time from `python -X importtime`.
+Fails (exit 1) when a subcommand exceeds its wall clock budget or imports a module it should not need
+
+    python -m bench.bench_startup [runs]
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.mock_ado import MockAdoServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUBCOMMANDS = {
+    "help": ["-h"],
+    "open": ["open", "1", "chrome"],
+    "list": ["list"],
+    "read": ["read", "1"],
+    "move": ["move", "1", "Done"],
+}
+# Median wall clock budget in ms per subcommand - includes interpreter startup
+BUDGET_MS = {"help": 150, "open": 150, "list": 500, "read": 500, "move": 500}
+# Modules a subcommand must not import
+FORBIDDEN_IMPORTS = {
+    "help": {"requests", "tabulate", "yaml", "bs4", "src.actions"},
+    "open": {"requests", "tabulate", "yaml", "bs4", "sqlite3", "csv"},
+}
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def run(args, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "src.ado", *args], cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def import_profile(args, env):
+    """
+    :return: Tuple of (total import time ms, set of top level modules imported)
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "src.ado", *args], cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total_us = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            total_us += int(match.group(1))
+            modules.add(match.group(4))
+    return total_us / 1000, modules
+
+
+def main(runs: int = 5):
+    failures = []
+    with MockAdoServer(item_count=50) as server, tempfile.TemporaryDirectory() as home:
+        config_file = os.path.join(home, "config.yml")
+        with open(config_file, "w") as f:
+            f.write(f"username: user@example.com\norganization: org\nproject: project\nbaseUrl: {server.base_url}\n"
+                    f"cacheTtl: 0\n")
+        bin_dir = os.path.join(home, "bin")
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, "chrome"), "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(os.path.join(bin_dir, "chrome"), 0o755)
+        env = {**os.environ, "HOME": home, "USERPROFILE": home, "ADO_CONFIG_FILE": config_file,
+               "PAT_TOKEN": "token", "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+
+        # Warm the config cache and the os file cache
+        run(["-h"], env)
+
+        print(f"{'subcommand':<10} {'wall ms':>8} {'budget':>7} {'import ms':>10}")
+        for name, args in SUBCOMMANDS.items():
+            wall = statistics.median(run(args, env) for _ in range(runs))
+            import_ms, modules = import_profile(args, env)
+            print(f"{name:<10} {wall:8.1f} {BUDGET_MS[name]:7d} {import_ms:10.1f}")
+            if wall > BUDGET_MS[name]:
+                failures.append(f"{name} took {wall:.1f}ms - budget {BUDGET_MS[name]}ms")
+            unexpected = modules & FORBIDDEN_IMPORTS.get(name, set())
+            if unexpected:
+                failures.append(f"{name} imported {', '.join(sorted(unexpected))}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,119 @@
+"""
+End to end benchmark of the `ado` subcommands against the local mock server
+
+Each scenario runs `python -m src.ado` as a subprocess against a fresh mock project of every size and records the
+wall time, the requests the server answered and the peak RSS of the cli process
+
+    python -m bench.bench_suite --sizes 10 1000 20000 --latency 0.02 --throttle-every 50 --output results.json
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.mock_ado import MockAdoServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10, 1000, 20000]
+READ_IDS = 50
+CREATE_MAXIMUM = 1000
+SCENARIOS = ["list", "list-ndjson", "read", "move", "create"]
+
+
+def write_plan(path: str, count: int):
+    """
+    A plan of one Product Backlog Item per 10 Tasks
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["key", "parent", "type", "title", "description"])
+        for i in range(count):
+            if i % 11 == 0:
+                parent_key = f"pbi{i}"
+                writer.writerow([parent_key, "", "Product Backlog Item", f"Bench PBI {i}", "<div>Bench</div>"])
+            else:
+                writer.writerow([f"task{i}", parent_key, "Task", f"Bench Task {i}", ""])
+
+
+def scenarios(size: int, workdir: str) -> dict:
+    plan = os.path.join(workdir, "plan.csv")
+    write_plan(plan, min(size, CREATE_MAXIMUM))
+    return {
+        "list": ["list"],
+        "list-ndjson": ["list", "--format", "ndjson"],
+        "read": ["read", *[str(i) for i in range(1, min(size, READ_IDS) + 1)], "--json"],
+        "move": ["move", "--iteration", "MockProject\\Sprint 1", "--allusers", "Done"],
+        "create": ["create", "--from-file", plan, "--state-file", os.path.join(workdir, "plan.state.json")],
+    }
+
+
+def run(args, env) -> dict:
+    """
+    :return: Dict of wall ms, exit code and peak rss (KiB, None where os.wait4 is unavailable)
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "src.ado", *args], cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        rss = usage.ru_maxrss if sys.platform != "darwin" else usage.ru_maxrss // 1024
+    else:
+        proc.wait()
+        rss = None
+    return {"wall_ms": (time.perf_counter() - start) * 1000, "exit": proc.returncode, "peak_rss_kib": rss}
+
+
+def bench_size(size: int, args) -> list:
+    results = []
+    for name in SCENARIOS:
+        # A fresh project and home per scenario so earlier moves, creates and caches do not leak into the next
+        with MockAdoServer(item_count=size, comment_count=args.comments, latency=args.latency,
+                           throttle_every=args.throttle_every, retry_after=args.retry_after,
+                           error_rate=args.error_rate) as server, tempfile.TemporaryDirectory() as home:
+            config_file = os.path.join(home, "config.yml")
+            with open(config_file, "w") as f:
+                f.write(f"username: user@example.com\norganization: org\nproject: project\nareaPath: MockProject\n"
+                        f"baseUrl: {server.base_url}\ncache: false\n")
+            env = {**os.environ, "HOME": home, "USERPROFILE": home, "ADO_CONFIG_FILE": config_file,
+                   "PAT_TOKEN": "token"}
+            result = run(scenarios(size, home)[name], env)
+            results.append({"scenario": name, "items": size, **result, "requests": server.requests,
+                            "connections": server.connections, "bytes": server.bytes_sent,
+                            "throttled": server.throttled, "errors": server.errors})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end ado benchmarks against the mock server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--comments", type=int, default=5, help="Maximum comments per work item")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every mock request")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every nth request with a 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a 503")
+    parser.add_argument("--output", help="Write the results as json to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'scenario':<12} {'items':>6} {'exit':>4} {'wall ms':>9} {'requests':>8} {'conns':>5} "
+          f"{'KiB sent':>9} {'peak rss KiB':>12}")
+    for size in args.sizes:
+        for result in bench_size(size, args):
+            results.append(result)
+            print(f"{result['scenario']:<12} {result['items']:>6} {result['exit']:>4} {result['wall_ms']:9.1f} "
+                  f"{result['requests']:>8} {result['connections']:>5} {result['bytes'] / 1024:9.1f} "
+                  f"{result['peak_rss_kib'] or '-':>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 1 if any(result["exit"] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
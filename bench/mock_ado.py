@@ -0,0 +1,460 @@
+"""
+Local stand-in for the Azure DevOps work item endpoints used by the cli
+
+Serves a synthetic project of work items with Epic -> Feature -> PBI -> Task hierarchies, html descriptions and
+paged comments, plus the reporting revisions log and the projects work item types, states and classification
+nodes. Item GETs carry an ETag and answer a matching If-None-Match with an empty 304. Latency, throttling
+(429 + Retry-After) and server errors can be injected. Counts the connections, requests and bytes served so
+connection reuse and request volume can be measured
+
+    python -m bench.mock_ado --items 1000 --port 8765 --latency 0.02 --throttle-every 50
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+USER = "user@example.com"
+OTHER_USER = "other@example.com"
+STATES = ["New", "Active", "Committed"]
+TYPES_BY_DEPTH = ["Epic", "Feature", "Product Backlog Item", "Task"]
+HIERARCHY_FANOUT = 4
+COMMENTS_PAGE_MAXIMUM = 200
+WIQL_MAXIMUM = 20000
+
+# Analytics OData WorkItems properties -> work item fields
+ODATA_FIELDS = {
+    "State": "System.State",
+    "WorkItemType": "System.WorkItemType",
+    "Iteration/IterationPath": "System.IterationPath",
+    "Area/AreaPath": "System.AreaPath",
+    "AssignedTo/UserEmail": "System.AssignedTo",
+    "RemainingWork": "Microsoft.VSTS.Scheduling.RemainingWork",
+}
+ODATA_FILTER = re.compile(r"(\S+) (eq|ne) '((?:[^']|'')*)'")
+WIQL_CLAUSE = re.compile(r"\[System\.(\w+)\]\s*(==|=|<>|>=|<=|>|<)\s*(?:\"([^\"]*)\"|'([^']*)'|(\d+))")
+OPERATORS = {
+    "=": lambda a, b: a == b,
+    "==": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def iso(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def patch_fields(patch: list) -> dict:
+    return {op["path"][len("/fields/"):]: op["value"] for op in patch if op["path"].startswith("/fields/")}
+
+
+def patch_parent(patch: list):
+    for op in patch:
+        if op["path"] == "/relations/-" and op["value"]["rel"] == "System.LinkTypes.Hierarchy-Reverse":
+            return int(op["value"]["url"].rstrip("/").rsplit("/", 1)[-1])
+    return None
+
+
+class WorkItemStore:
+    """
+    Synthetic work items. Item i > 1 is a child of item (i - 2) // HIERARCHY_FANOUT + 1
+    """
+
+    def __init__(self, item_count: int, max_comments: int = 0, seed: int = 0):
+        self.lock = threading.Lock()
+        self.items = {}
+        # Reporting revisions log - a continuation token is an index into it
+        self.revisions = []
+        self.last_id = item_count
+        self.max_comments = max_comments
+        rng = random.Random(seed)
+        start = datetime.now(timezone.utc) - timedelta(seconds=item_count + 60)
+        for i in range(1, item_count + 1):
+            parent = (i - 2) // HIERARCHY_FANOUT + 1 if i > 1 else None
+            depth = self.items[parent]["depth"] + 1 if parent else 0
+            self._add(i, parent, depth, {
+                "System.WorkItemType": TYPES_BY_DEPTH[min(depth, len(TYPES_BY_DEPTH) - 1)],
+                "System.Title": f"Work Item {i}",
+                "System.State": STATES[i % len(STATES)],
+                "System.AreaPath": "MockProject",
+                "System.IterationPath": f"MockProject\\Sprint {i % 5 + 1}",
+                "System.AssignedTo": {"displayName": "Mock User", "uniqueName": OTHER_USER if i % 10 == 0 else USER},
+                "System.Tags": "backend; api" if i % 3 == 0 else "frontend",
+                "System.Description": f"<div>Description of <b>work item {i}</b> &amp; its details</div>"
+                                      f"<ul><li>{rng.random():.6f}</li></ul>",
+                "Microsoft.VSTS.Common.AcceptanceCriteria": "<ul><li>Works</li><li>Is tested</li></ul>",
+                "System.CommentCount": i % (max_comments + 1),
+                "Microsoft.VSTS.Scheduling.RemainingWork": i % 8,
+                "System.ChangedDate": iso(start + timedelta(seconds=i)),
+                "System.CreatedDate": iso(start),
+            })
+
+    def _add(self, work_item_id: int, parent, depth: int, fields: dict):
+        self.items[work_item_id] = {"id": work_item_id, "rev": 1, "parent": parent, "children": [], "depth": depth,
+                                    "fields": {"System.Id": work_item_id, "System.Rev": 1, **fields}}
+        if parent in self.items:
+            self.items[parent]["children"].append(work_item_id)
+        self._log(self.items[work_item_id])
+
+    def _log(self, item: dict):
+        self.revisions.append({"id": item["id"], "rev": item["rev"], "fields": dict(item["fields"])})
+
+    def create(self, work_item_type: str, patch: list) -> dict:
+        with self.lock:
+            self.last_id += 1
+            work_item_id = self.last_id
+            parent = patch_parent(patch)
+            depth = self.items[parent]["depth"] + 1 if parent in self.items else 0
+            now = iso(datetime.now(timezone.utc))
+            self._add(work_item_id, parent, depth, {
+                "System.WorkItemType": work_item_type, "System.State": "New", "System.CommentCount": 0,
+                "System.AssignedTo": {"displayName": "Mock User", "uniqueName": USER},
+                "System.ChangedDate": now, "System.CreatedDate": now, **patch_fields(patch)})
+            return self.items[work_item_id]
+
+    def update(self, work_item_id: int, patch: list):
+        with self.lock:
+            item = self.items.get(work_item_id)
+            if item is None:
+                return None
+            item["rev"] += 1
+            item["fields"].update(patch_fields(patch))
+            item["fields"].pop("System.History", None)
+            item["fields"]["System.Rev"] = item["rev"]
+            item["fields"]["System.ChangedDate"] = iso(datetime.now(timezone.utc))
+            self._log(item)
+            return item
+
+    def query(self, wiql: str) -> list:
+        """
+        :return: Ids matching the AND-ed [System.Field] comparisons in the WIQL in id order. Other clauses are ignored
+        """
+        descending = bool(re.search(r"ORDER BY \[System\.Id\] DESC", wiql, re.IGNORECASE))
+        wiql = re.split(r"\sORDER BY\s", wiql, flags=re.IGNORECASE)[0]
+        clauses = []
+        for field, operator, double_quoted, single_quoted, number in WIQL_CLAUSE.findall(wiql):
+            value = int(number) if number else (double_quoted if double_quoted or not single_quoted else single_quoted)
+            clauses.append((field, OPERATORS[operator], value))
+
+        def value_of(item, field):
+            if field == "Id":
+                return item["id"]
+            if field == "Parent":
+                return item["parent"] or ""
+            value = item["fields"].get(f"System.{field}", "")
+            return value.get("uniqueName", "") if isinstance(value, dict) else value
+
+        ids = [item["id"] for item in self.items.values()
+               if all(compare(value_of(item, field), value) for field, compare, value in clauses)]
+        return ids[::-1] if descending else ids
+
+    def aggregate(self, apply: str) -> list:
+        """
+        Evaluates an Analytics $apply of filter(... eq/ne ... and ...)/groupby((...), aggregate(...))
+        :return: Aggregate rows with navigation properties nested like the Analytics service
+        """
+        match = re.match(r"(?:filter\((.*)\)/)?groupby\(\(([^)]*)\), aggregate\((.*)\)\)$", apply)
+        filters = [(prop, operator == "eq", value.replace("''", "'"))
+                   for prop, operator, value in ODATA_FILTER.findall(match.group(1) or "")]
+        keys = [key.strip() for key in match.group(2).split(",")]
+        sums = [(part.split(" with sum as ")[0], part.split(" as ")[-1])
+                for part in match.group(3).split(", ") if " with sum as " in part]
+
+        def value_of(item, prop):
+            value = item["fields"].get(ODATA_FIELDS.get(prop, prop))
+            return value.get("uniqueName") if isinstance(value, dict) else value
+
+        groups = {}
+        for item in self.items.values():
+            if all((value_of(item, prop) == value) == equal for prop, equal, value in filters):
+                group = groups.setdefault(tuple(value_of(item, key) for key in keys),
+                                          {"Count": 0, **{alias: 0 for _, alias in sums}})
+                group["Count"] += 1
+                for prop, alias in sums:
+                    group[alias] += value_of(item, prop) or 0
+
+        rows = []
+        for values, totals in groups.items():
+            row = dict(totals)
+            for key, value in zip(keys, values):
+                if "/" in key:
+                    row.setdefault(key.split("/")[0], {})[key.split("/")[1]] = value
+                else:
+                    row[key] = value
+            rows.append(row)
+        return rows
+
+    def render(self, item: dict, project_url: str, fields: list = None, expand: str = "All") -> dict:
+        url = f"{project_url}/_apis/wit/workItems/{item['id']}"
+        if fields:
+            return {"id": item["id"], "rev": item["rev"], "url": url,
+                    "fields": {k: v for k, v in item["fields"].items() if k in fields}}
+        work_item = {"id": item["id"], "rev": item["rev"], "fields": dict(item["fields"]), "url": url}
+        if item["parent"]:
+            work_item["fields"]["System.Parent"] = item["parent"]
+        if expand.lower() in ("relations", "all"):
+            relations = [{"rel": "System.LinkTypes.Hierarchy-Forward", "url": f"{project_url}/_apis/wit/workItems/{c}",
+                          "attributes": {"name": "Child"}} for c in item["children"]]
+            if item["parent"]:
+                relations.append({"rel": "System.LinkTypes.Hierarchy-Reverse", "attributes": {"name": "Parent"},
+                                  "url": f"{project_url}/_apis/wit/workItems/{item['parent']}"})
+            work_item["relations"] = relations
+        if expand.lower() in ("links", "all"):
+            work_item["_links"] = {"self": {"href": url}, "workItemComments": {"href": f"{url}/comments"}}
+        return work_item
+
+    def revisions_page(self, start: int, page_size: int, fields: list = None, latest_only: bool = False) -> dict:
+        with self.lock:
+            log = self.revisions[start:start + page_size]
+            end = start + len(log)
+            last_batch = end >= len(self.revisions)
+        if latest_only:
+            log = [revision for revision in log if revision["rev"] == self.items[revision["id"]]["rev"]]
+        values = [{"id": revision["id"], "rev": revision["rev"],
+                   "fields": {k: v for k, v in revision["fields"].items() if not fields or k in fields}}
+                  for revision in log]
+        return {"values": values, "continuationToken": str(end), "isLastBatch": last_batch}
+
+    def comments(self, work_item_id: int, start: int, top: int) -> dict:
+        count = self.items[work_item_id]["fields"]["System.CommentCount"] if work_item_id in self.items else 0
+        end = min(start + min(top, COMMENTS_PAGE_MAXIMUM), count)
+        comments = [{"id": i, "text": f"<p>Comment <i>{i}</i> on {work_item_id}</p>",
+                     "revisedBy": {"displayName": "Mock User", "uniqueName": USER}} for i in range(start, end)]
+        page = {"totalCount": count, "count": len(comments), "comments": comments}
+        if end < count:
+            page["continuationToken"] = str(end)
+        return page
+
+
+class MockAdoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _send(self, payload, status=200, headers: dict = None, validate: bool = False):
+        data = json.dumps(payload).encode()
+        headers = dict(headers or {})
+        if validate:
+            # Strong ETag of the body - a matching If-None-Match is answered with an empty 304
+            headers["ETag"] = f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status, data = 304, b""
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_sent += len(data)
+            self.server.not_modified += status == 304
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _fault(self) -> bool:
+        """
+        Applies the injected latency and answers with a 429 or 503 when one is due
+        :return: True if a fault response was sent
+        """
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.seen += 1
+            throttle = server.throttle_every and server.seen % server.throttle_every == 0
+            error = not throttle and server.error_rate and server.rng.random() < server.error_rate
+            server.throttled += bool(throttle)
+            server.errors += bool(error)
+        if throttle:
+            self._send({"message": "TF400733: Request was throttled"}, status=429,
+                       headers={"Retry-After": str(server.retry_after), "X-RateLimit-Remaining": "0",
+                                "X-RateLimit-Delay": str(server.retry_after)})
+            return True
+        if error:
+            self._send({"message": "Injected server error"}, status=503)
+            return True
+        return False
+
+    def _route(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.lstrip("/").split("/")
+        return parsed.path, parse_qs(parsed.query), parts
+
+    def _project_url(self, org: str, project: str) -> str:
+        return f"http://{self.headers['Host']}/{org}/{project}"
+
+    def do_POST(self):
+        body = self._body()
+        if self._fault():
+            return
+        path, query, parts = self._route()
+        store = self.server.store
+        if path.endswith("/_apis/wit/wiql"):
+            ids = store.query(body["query"])
+            if "$top" in query:
+                ids = ids[:int(query["$top"][0])]
+            if len(ids) > self.server.wiql_maximum:
+                return self._send({"message": f"VS402337: The number of work items returned exceeds the size limit "
+                                              f"of {self.server.wiql_maximum}. Change the query to return fewer "
+                                              f"items."}, status=400)
+            project_url = self._project_url(*parts[:2])
+            return self._send({"queryType": "flat", "asOf": iso(datetime.now(timezone.utc)),
+                               "workItems": [{"id": i, "url": f"{project_url}/_apis/wit/workItems/{i}"} for i in ids]})
+        if path.endswith("/_apis/wit/workitemsbatch"):
+            project_url = self._project_url(*parts[:2])
+            values = [store.render(store.items[i], project_url, body.get("fields"), body.get("$expand", "None"))
+                      for i in body["ids"] if i in store.items]
+            return self._send({"count": len(values), "value": values})
+        if path.endswith("/_apis/wit/$batch"):
+            values = []
+            for operation in body:
+                project_url = self._project_url(parts[0], operation["uri"].lstrip("/").split("/")[0])
+                update = re.search(r"/workitems/(\d+)", operation["uri"])
+                if update:
+                    item = store.update(int(update.group(1)), operation["body"])
+                else:
+                    item = store.create(re.search(r"\$([^?]+)", operation["uri"]).group(1), operation["body"])
+                if item is None:
+                    values.append({"code": 404, "headers": {}, "body": json.dumps({"message": "Not found"})})
+                else:
+                    values.append({"code": 200, "headers": {}, "body": json.dumps(store.render(item, project_url))})
+            return self._send({"count": len(values), "value": values})
+        match = re.search(r"/_apis/wit/workitems/\$(.+)$", path)
+        if match:
+            return self._send(store.render(store.create(match.group(1), body), self._project_url(*parts[:2])))
+        self._send({"message": "not found"}, status=404)
+
+    def do_PATCH(self):
+        body = self._body()
+        if self._fault():
+            return
+        path, _, parts = self._route()
+        match = re.search(r"/_apis/wit/workitems/(\d+)$", path, re.IGNORECASE)
+        item = self.server.store.update(int(match.group(1)), body) if match else None
+        if item is None:
+            return self._send({"message": "not found"}, status=404)
+        self._send(self.server.store.render(item, self._project_url(*parts[:2])))
+
+    def do_GET(self):
+        if self._fault():
+            return
+        path, query, parts = self._route()
+        store = self.server.store
+        if re.search(r"/_odata/[^/]+/WorkItems$", path):
+            return self._send({"value": store.aggregate(query["$apply"][0])})
+        if path.endswith("/_apis/wit/reporting/workitemrevisions"):
+            return self._send(store.revisions_page(int(query.get("continuationToken", ["0"])[0]),
+                                                   int(query.get("$maxPageSize", ["1000"])[0]),
+                                                   query["fields"][0].split(",") if "fields" in query else None,
+                                                   query.get("includeLatestOnly", ["false"])[0] == "true"))
+        if path.endswith("/_apis/wit/workitemtypes"):
+            return self._send({"value": [{"name": name, "isDisabled": False} for name in TYPES_BY_DEPTH]})
+        if re.search(r"/_apis/wit/workitemtypes/[^/]+/states$", path):
+            return self._send({"value": [{"name": state} for state in STATES + ["Done", "Removed"]]})
+        if path.endswith("/_apis/wit/classificationnodes"):
+            return self._send({"value": [
+                {"name": "MockProject", "structureType": "area"},
+                {"name": "MockProject", "structureType": "iteration",
+                 "children": [{"name": f"Sprint {i}", "structureType": "iteration"} for i in range(1, 6)]},
+            ]})
+        match = re.search(r"/_apis/wit/workitems/(\d+)/comments$", path, re.IGNORECASE)
+        if match:
+            return self._send(store.comments(int(match.group(1)), int(query.get("continuationToken", ["0"])[0]),
+                                             int(query.get("$top", [str(COMMENTS_PAGE_MAXIMUM)])[0])), validate=True)
+        match = re.search(r"/_apis/wit/workitems/(\d+)$", path, re.IGNORECASE)
+        if match and int(match.group(1)) in store.items:
+            fields = query["fields"][0].split(",") if "fields" in query else None
+            return self._send(store.render(store.items[int(match.group(1))], self._project_url(*parts[:2]), fields,
+                                           query.get("$expand", ["None"])[0]), validate=True)
+        self._send({"message": "not found"}, status=404)
+
+
+class MockAdoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, item_count: int = 10, port: int = 0, comment_count: int = 0, latency: float = 0,
+                 throttle_every: int = 0, retry_after: int = 1, error_rate: float = 0,
+                 wiql_maximum: int = WIQL_MAXIMUM):
+        """
+        :param item_count: Work items generated
+        :param comment_count: Maximum comments per work item
+        :param latency: Seconds added to every request
+        :param throttle_every: Answer every nth request with 429 + Retry-After
+        :param retry_after: Retry-After seconds sent with a 429
+        :param error_rate: Fraction of requests answered with a 503
+        :param wiql_maximum: WIQL queries matching more work items fail like Azure DevOps
+        """
+        super().__init__(("127.0.0.1", port), MockAdoHandler)
+        self.lock = threading.Lock()
+        self.store = WorkItemStore(item_count, max_comments=comment_count)
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.wiql_maximum = wiql_maximum
+        self.rng = random.Random(0)
+        self.reset_counters()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.bytes_sent = 0
+            self.seen = 0
+            self.throttled = 0
+            self.errors = 0
+            self.not_modified = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock Azure DevOps server")
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=5, help="Maximum comments per work item")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+    server = MockAdoServer(item_count=args.items, port=args.port, comment_count=args.comments, latency=args.latency,
+                           throttle_every=args.throttle_every, retry_after=args.retry_after,
+                           error_rate=args.error_rate)
+    print(f"Serving {args.items} work items on {server.base_url} - set baseUrl: {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,8 +13,7 @@ setup(
         'PyYAML==6.0',
         'tabulate==0.9.0',
         'requests==2.28.2',
-        'wcwidth==0.2.5',
-        'beautifulsoup4==4.10.0'
+        'wcwidth==0.2.5'
     ],
     entry_points={
         'console_scripts': ['ado=src.ado:ado'],
@@ -1,11 +1,17 @@
+import json
 import logging
 import os
-import tabulate
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from itertools import chain
 
-tabulate.PRESERVE_WHITESPACE = True
-
-from src.azureapi import get_source_work_items_from_wiql, build_wiql, get_work_items_batch, create_source_work_item, \
-    update_work_item, get_comments
+from src import profiling
+from src.hierarchy import HierarchyIndex
+from src.projection import parse_columns, project_fields, column_header, cell_value, INDENTED_COLUMNS, \
+    CARD_FIELDS, Projection, FULL_PROJECTION
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +25,8 @@ Y = '\033[33m'  # Yellow
 # Can change to add custom colors to work item types in your project
 c = {"Product Backlog Item": B, "Task": Y, "Feature": P, "Epic": O}
 COLOR_ENABLED = False
+DEFAULT_WATCH_INTERVAL = 10
+DEFAULT_WATCH_MAX_INTERVAL = 300
 
 
 def color(text, color):
@@ -37,6 +45,13 @@ def underline(text):
     return '\033[4m' + text + '\033[0m'
 
 
+def tabulate(*args, **kwargs):
+    # Imported on first use - subcommands that print no tables never load tabulate/wcwidth
+    import tabulate as tabulate_module
+    tabulate_module.PRESERVE_WHITESPACE = True
+    return tabulate_module.tabulate(*args, **kwargs)
+
+
 def add_color(key, value):
     if COLOR_ENABLED:
         return f"{c.get(key, W)}{value}{W}"
@@ -44,24 +59,217 @@ def add_color(key, value):
         return str(value)
 
 
-def process_children(work_item_details, elem, res, indent="\u2517\u2501 "):
-    if "relations" not in elem:
+def get_client(run_args):
+    # Network stack is only imported by subcommands that talk to Azure DevOps
+    from src.azureapi import AdoClient
+    from src.httpcache import open_http_cache
+    return AdoClient(organization=run_args['organization'], project_name=run_args['project'],
+                     base_url=run_args.get('baseUrl'), max_workers=run_args.get('maxWorkers'),
+                     http_cache=open_http_cache(run_args), analytics_url=run_args.get('analyticsUrl'),
+                     max_request_rate=run_args.get('maxRequestRate'))
+
+
+def parse_targets(projects) -> list:
+    """
+    :param projects: Comma separated string or list of organization/project e.g. "org1/projA,org2/projC"
+    :return: List of unique (organization, project) tuples in the order given
+    """
+    if isinstance(projects, str):
+        projects = projects.split(",")
+    targets = []
+    for target in projects:
+        organization, _, project = str(target).strip().partition("/")
+        if not organization or not project:
+            raise ValueError(f"Invalid project {target} - expected organization/project")
+        if (organization, project) not in targets:
+            targets.append((organization, project))
+    return targets
+
+
+def fan_out(run_args, targets: list, work, failed: list):
+    """
+    Runs work(client) for every organization/project target concurrently - each with its own AdoClient
+    Chunks are yielded as soon as any target produces one. A target that fails (or is still throttled once its
+    retries run out) is logged and added to failed without holding up the others
+    :param work: Callable taking an AdoClient and returning an iterable of chunks
+    :param failed: List the failed targets are appended to
+    :return: Generator of (target, chunk)
+    """
+    # Bounded so fast targets cannot run ahead of the consumer
+    results = queue.Queue(maxsize=2 * len(targets))
+    stopped = threading.Event()
+    done = object()
+
+    def offer(item) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(target):
+        try:
+            client = get_client({**run_args, "organization": target[0], "project": target[1]})
+            for chunk in work(client):
+                if not offer((target, chunk)):
+                    return
+        except Exception as ex:
+            logger.error(f"{'/'.join(target)} failed: {ex}")
+            failed.append(target)
+        finally:
+            offer((target, done))
+
+    executor = ThreadPoolExecutor(max_workers=len(targets))
+    try:
+        for target in targets:
+            executor.submit(run, target)
+        remaining = len(targets)
+        while remaining:
+            target, chunk = results.get()
+            if chunk is done:
+                remaining -= 1
+            else:
+                yield target, chunk
+    finally:
+        # The consumer stopped early e.g. `ado list --format csv | head`
+        stopped.set()
+        executor.shutdown()
+
+
+def tag_project(work_items: list, target: tuple) -> list:
+    """
+    Records the organization/project each work item was listed from for the Project column
+    """
+    for item in work_items:
+        item["project"] = "/".join(target)
+    return work_items
+
+
+def batch_args(projection: Projection) -> dict:
+    if projection.fields is not None:
+        return {"fields": projection.fields}
+    return {"expand": "Relations" if projection.relations else "None"}
+
+
+def query_work_items(client, run_args, area_path, assigned_to, projection=FULL_PROJECTION):
+    """
+    Runs the list WIQL query and returns the matching work item details with the fields in projection
+    :return: List of work item details in WIQL order
+    """
+    return [item for chunk in iter_work_items(client, run_args, area_path, assigned_to, projection) for item in chunk]
+
+
+def iter_work_items(client, run_args, area_path, assigned_to, projection=FULL_PROJECTION):
+    """
+    Runs the list WIQL query and yields the matching work item details in WIQL order, a chunk at a time
+    Each downloaded chunk is yielded as soon as it arrives so callers can stream output
+    With the cache enabled a query synced within cacheTtl is served locally. Otherwise only the items
+    changed since the previous sync watermark (or missing from the cache) are downloaded
+    :return: Generator of lists of work item details
+    """
+    from src.azureapi import build_wiql, BATCH_MAXIMUM, FailedChunk
+    from src.cache import open_cache, DEFAULT_CACHE_TTL
+
+    wiql = build_wiql(area_path=area_path, assigned_to=assigned_to)
+    cache = open_cache(run_args)
+    if cache is None:
+        # Ids stream from the WIQL windows straight into batch fetching so memory stays bounded
+        as_of, windows = client.query_ids(wiql)
+        yield from client.iter_work_items_batch(source_ids=chain.from_iterable(windows), **batch_args(projection))
         return
 
-    for link in elem['relations']:
-        if link['rel'] != "System.LinkTypes.Hierarchy-Forward":
-            continue
-        if link['url'] not in work_item_details:
-            continue
-        child = work_item_details.pop(link['url'])
-        res.append(
-            [
-                indent + add_color(child["fields"]["System.WorkItemType"], child["id"]),
-                indent + add_color(child["fields"]["System.WorkItemType"], child["fields"]["System.WorkItemType"]),
-                indent + add_color(child["fields"]["System.WorkItemType"], child["fields"]["System.Title"]),
-                add_color(child["fields"]["System.WorkItemType"], child["fields"]["System.IterationPath"])
-            ])
-        process_children(work_item_details, child, res, indent=f"  {indent}")
+    query_key = f"{client.organization}/{client.project_name}:{wiql['query']}:{projection}"
+    sync = None if run_args.get("force") else cache.get_sync(query_key)
+
+    if sync is not None and time.time() - sync[1] < run_args.get("cacheTtl", DEFAULT_CACHE_TTL):
+        ids = sync[2]
+        if len(cache.get_revs(client.organization, ids, projection=projection)) == len(ids):
+            logger.debug(f"Serving {len(ids)} work items from cache {cache.path}")
+            # A window of payloads at a time so memory stays bounded
+            for start in range(0, len(ids), BATCH_MAXIMUM):
+                yield merge_window(cache, client, ids[start: start + BATCH_MAXIMUM], [], projection)
+            return
+
+    as_of, windows = client.query_ids(wiql)
+    ids = list(chain.from_iterable(windows))
+    stale = ids
+    if sync is not None:
+        cached_ids = cache.get_revs(client.organization, ids, projection=projection)
+        _, changed = client.query_ids(
+            build_wiql(area_path=area_path, assigned_to=assigned_to, changed_since=sync[0]))
+        changed_ids = set(chain.from_iterable(changed))
+        stale = [i for i in ids if i in changed_ids or i not in cached_ids]
+    logger.debug(f"Cache refresh downloading {len(stale)} of {len(ids)} work items")
+
+    # Merge downloaded chunks with unchanged cached items. Each yield covers the ids up to the
+    # last id of the downloaded chunk so output stays in WIQL order
+    positions = {work_item_id: i for i, work_item_id in enumerate(ids)}
+    position = 0
+    failed = 0
+    chunks = client.iter_work_items_batch(source_ids=stale, **batch_args(projection)) if stale else []
+    for chunk_number, fetched in enumerate(chunks):
+        if isinstance(fetched, FailedChunk):
+            failed += len(fetched.ids)
+        cache.put_work_items(client.organization, fetched, projection=projection)
+        requested = stale[chunk_number * BATCH_MAXIMUM: (chunk_number + 1) * BATCH_MAXIMUM]
+        end = positions[requested[-1]] + 1
+        yield merge_window(cache, client, ids[position:end], fetched, projection)
+        position = end
+    for start in range(position, len(ids), BATCH_MAXIMUM):
+        yield merge_window(cache, client, ids[start: start + BATCH_MAXIMUM], [], projection)
+
+    if failed:
+        # Keep the previous watermark so the next refresh downloads the failed items again
+        logger.warning(f"{failed} work items could not be downloaded - cached copies may be out of date")
+        return
+    watermark = as_of or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    cache.set_sync(query_key, watermark, ids)
+
+
+def record_writes(run_args, client, work_items: list, unknown_ids=()):
+    """
+    Updates the work item cache with the results of a create or update so the next list/read is not stale
+    """
+    from src.cache import open_cache
+
+    cache = open_cache(run_args)
+    if cache is not None:
+        cache.record_writes(client.organization, work_items, unknown_ids)
+
+
+def merge_window(cache, client, window, fetched, projection):
+    """
+    :return: Work items for the window of ids taken from fetched or else the cache
+    """
+    fetched = {item["id"]: item for item in fetched if item is not None}
+    cached = cache.get_work_items(client.organization, [i for i in window if i not in fetched], projection=projection)
+    return [fetched.get(i) or cached[i] for i in window if i in fetched or i in cached]
+
+
+def build_row(elem, columns, indent=""):
+    return [(indent if col in INDENTED_COLUMNS else "") + cell_value(elem, col) for col in columns]
+
+
+def render_table(rows: list, row_types: list, headers: list, run_args) -> str:
+    """
+    Small tables go through tabulate so any tablefmt works. Larger ones use the single pass fast_table renderer
+    with colour applied once per row. The Title column is truncated to the terminal width
+    """
+    from src.table import fast_table, fit_column, terminal_size, DEFAULT_FAST_TABLE_ROWS
+
+    size = terminal_size()
+    if size is not None and "Title" in headers:
+        fit_column(rows, headers, headers.index("Title"), size.columns)
+    if len(rows) > run_args.get("fastTableRows", DEFAULT_FAST_TABLE_ROWS):
+        return "\n".join(fast_table(rows, headers, [c.get(t, W) for t in row_types] if COLOR_ENABLED else None))
+    return tabulate([[add_color(t, value) for value in row] for row, t in zip(rows, row_types)], headers=headers,
+                    tablefmt=run_args.get('tablefmt', "simple"))
+
+
+def hierarchy_indent(depth: int) -> str:
+    return "  " * (depth - 1) + "\u2517\u2501 " if depth else ""
 
 
 def list_ado_work_items(run_args):
@@ -70,95 +278,121 @@ def list_ado_work_items(run_args):
         logger.info("PAT_TOKEN must be set in the environment")
         return
 
+    from src.metadata import validate
+    from src.table import page
+
     if run_args["all"]:
         area_path = None
     else:
         area_path = run_args['areaPath']
+    assigned_to = None if run_args.get("allusers") else run_args['username']
+    found_for = "all users" if assigned_to is None else assigned_to
 
-    found_items = get_source_work_items_from_wiql(organization=run_args['organization'],
-                                                  project_name=run_args['project'],
-                                                  wiql=build_wiql(area_path=area_path,
-                                                                  assigned_to=run_args['username']))
+    try:
+        columns = parse_columns(run_args.get("columns"), tags=run_args.get("tags", False))
+        # --projects lists every organization/project concurrently into one table or stream
+        targets = parse_targets(run_args["projects"]) if run_args.get("projects") else None
+    except ValueError as ex:
+        logger.error(ex)
+        return
+    if targets:
+        found_for += f" in {len(targets)} projects"
+        if "Project" not in columns:
+            columns.insert(0, "Project")
+    if not targets:
+        error = validate(run_args, get_client(run_args), area_paths=[area_path])
+        if error:
+            logger.error(error)
+            return 1
+    projection = project_fields(columns, hierarchy=run_args.get("hierarchy", False))
+    failed = []
+
+    output_format = run_args.get("format") or "table"
+    if output_format != "table":
+        if run_args.get("hierarchy", False):
+            logger.debug(f"hierarchy is ignored by --format {output_format}")
 
-    found_map = ({elem["url"]: elem["id"] for elem in found_items["workItems"]})
-    ids = list(found_map.values())
-    work_item_details = get_work_items_batch(organization=run_args['organization'],
-                                             project_name=run_args['project'], source_ids=ids)
+        def stream(client):
+            return iter_work_items(client, run_args, area_path=area_path, assigned_to=assigned_to,
+                                   projection=project_fields(columns))
+
+        if targets:
+            chunks = (tag_project(chunk, target) for target, chunk in fan_out(run_args, targets, stream, failed))
+        else:
+            chunks = stream(get_client(run_args))
+        from src.output import write_stream
+
+        with profiling.span("write_stream"):
+            count = write_stream(chunks, columns, output_format)
+        logger.info(f"{count} Work Items Found for {found_for}")
+        return 1 if failed else None
+
+    def list_rows(client) -> list:
+        """
+        :return: List of (work item, indent) rows of one project
+        """
+        with profiling.span("query work items"):
+            work_item_details = query_work_items(client, run_args, area_path=area_path, assigned_to=assigned_to,
+                                                 projection=projection)
+        if not run_args.get("hierarchy", False):
+            return [(elem, "") for elem in work_item_details]
+
+        from src.azureapi import CLOSED_STATES
+        with profiling.span("hierarchy"):
+            index = HierarchyIndex(work_item_details)
+            index.complete(lambda ids: client.get_work_items_batch(source_ids=ids, expand="Relations"),
+                           exclude_states=CLOSED_STATES)
+            return [(elem, hierarchy_indent(depth)) for elem, depth in index.walk()]
+
+    if targets:
+        # Every project's rows arrive as one chunk. The table keeps the order the projects were given in
+        listed = dict(fan_out(run_args, targets, lambda client: [list_rows(client)], failed))
+        rows = []
+        for target in targets:
+            tag_project([elem for elem, _ in listed.get(target, [])], target)
+            rows += listed.get(target, [])
+    else:
+        rows = list_rows(get_client(run_args))
 
     if run_args.get("color", False):
         global COLOR_ENABLED
         COLOR_ENABLED = True
 
-    res = []
-
-    work_item_details = {elem["url"]: elem for elem in work_item_details}
-    while work_item_details:
-        elem = work_item_details.pop(list(work_item_details.keys())[0])
-        res.append(
-            [
-                add_color(elem["fields"]["System.WorkItemType"], elem["id"]),
-                add_color(elem["fields"]["System.WorkItemType"], elem["fields"]["System.WorkItemType"]),
-                add_color(elem["fields"]["System.WorkItemType"], elem["fields"]["System.Title"]),
-                add_color(elem["fields"]["System.WorkItemType"], elem["fields"]["System.IterationPath"])
-            ])
-        if run_args.get("hierarchy", False):
-            process_children(work_item_details, elem, res)
-
-    print(tabulate.tabulate(res, headers=["ID", "Type", "Title", "Iteration", "Tags", "State"],
-                            tablefmt=run_args.get('tablefmt', "simple")))
-    print(f"\n{len(res)} Work Items Found for {run_args['username']}")
+    with profiling.span("render table"):
+        res = [build_row(elem, columns, indent) for elem, indent in rows]
+        table = render_table(res, [elem["fields"]["System.WorkItemType"] for elem, _ in rows],
+                             [column_header(col) for col in columns], run_args)
+    page(f"{table}\n\n{len(res)} Work Items Found for {found_for}", run_args)
+    return 1 if failed else None
 
 
-def create_ado_work_items(run_args):
-    logger.debug(run_args)
-    if os.environ.get("PAT_TOKEN") is None:
-        logger.info("PAT_TOKEN must be set in the environment")
-        return
-
+def build_create_body(client, fields: dict, parent=None):
+    """
+    :param fields: Field reference name -> value
+    :param parent: Optional ID of the parent work item
+    :return: json-patch document creating a work item
+    """
     work_item_create_body = [
         {
             "op": "add",
-            "path": "/fields/System.AreaPath",
-            "value": run_args['areaPath'],
-        },
-        {
-            "op": "add",
-            "path": "/fields/System.AssignedTo",
-            "value": run_args['username'],
-        },
-        {
-            "op": "add",
-            "path": "/fields/System.Title",
-            "value": run_args['title'],
-        },
-        {
-            "op": "add",
-            "path": "/fields/System.Description",
-            "value": run_args['desc'],
-        }
+            "path": f"/fields/{field}",
+            "value": value,
+        } for field, value in fields.items()
     ]
 
-    if run_args['parent']:
+    if parent:
         work_item_create_body.append({
             "op": "add",
             "path": "/relations/-",
             "value": {
                 "rel": "System.LinkTypes.Hierarchy-Reverse",
-                "url": f"https://dev.azure.com/{run_args['organization']}/{run_args['project']}/_apis/wit/workItems/{run_args['parent']}"
+                "url": client.work_item_url(parent)
             },
         })
+    return work_item_create_body
 
-    if run_args.get("iteration", None) is not None:
-        work_item_create_body.append({
-            "op": "add",
-            "path": "/fields/System.IterationPath",
-            "value": run_args['iteration'],
-        })
-
-    res = create_source_work_item(organization=run_args['organization'],
-                                  project_name=run_args['project'], work_item_type=run_args['wit'],
-                                  work_item_create_body=work_item_create_body)
 
+def print_created(run_args, res):
     if run_args.get("color", False):
         print(
             f"Created {add_color(res['fields']['System.WorkItemType'], res['id'])} {add_color(res['fields']['System.WorkItemType'], res['fields']['System.WorkItemType'])} {res['fields']['System.Title']}")
@@ -166,6 +400,186 @@ def create_ado_work_items(run_args):
         print(f"Created {res['id']} {res['fields']['System.WorkItemType']} {res['fields']['System.Title']}")
 
 
+def create_ado_work_items(run_args):
+    logger.debug(run_args)
+    if os.environ.get("PAT_TOKEN") is None:
+        logger.info("PAT_TOKEN must be set in the environment")
+        return
+
+    from src.metadata import validate
+
+    if run_args.get("from_file"):
+        return create_ado_work_items_from_file(run_args)
+    if run_args.get("title") is None or run_args.get("desc") is None:
+        logger.error("title and desc are required unless --from-file is passed")
+        return 1
+
+    client = get_client(run_args)
+    error = validate(run_args, client, work_item_types=[run_args['wit']], area_paths=[run_args['areaPath']],
+                     iterations=[run_args.get("iteration")])
+    if error:
+        logger.error(error)
+        return 1
+    fields = {
+        "System.AreaPath": run_args['areaPath'],
+        "System.AssignedTo": run_args['username'],
+        "System.Title": run_args['title'],
+        "System.Description": run_args['desc'],
+    }
+    if run_args.get("iteration", None) is not None:
+        fields["System.IterationPath"] = run_args['iteration']
+
+    res = client.create_work_item(work_item_type=run_args['wit'],
+                                  work_item_create_body=build_create_body(client, fields, run_args['parent']))
+    record_writes(run_args, client, [res])
+    print_created(run_args, res)
+
+
+def recover_pending(client, state, nodes) -> list:
+    """
+    Looks up work items from a batch that was sent but never recorded in the plan state
+    so resuming does not create them twice
+    A pending item matches a work item of its title, type and parent created since the batch was sent that no other
+    plan item already claims. Items with more than one match stay pending as the right one cannot be told apart
+    :return: Keys left pending
+    """
+    by_key = {node.key: node for node in nodes}
+    ambiguous = []
+    # Parents are recovered before their children so the childrens parent filter is known
+    for key, sent_at in sorted(state.pending.items(), key=lambda pending: getattr(by_key.get(pending[0]), "level", 0)):
+        node = by_key.get(key)
+        if node is None:
+            state.pending.pop(key)
+            continue
+        parent = state.created.get(node.parent_key) if node.parent_key is not None else node.parent_id
+        if node.parent_key is not None and parent is None:
+            # Children are only sent once their parent is recorded
+            state.pending.pop(key)
+            continue
+        title = node.title.replace("'", "''")
+        query = (f"Select [System.Id] From WorkItems Where [System.TeamProject] = @project"
+                 f" AND [System.Title] = '{title}' AND [System.WorkItemType] = '{node.work_item_type}'"
+                 f" AND [System.CreatedDate] >= '{sent_at}'")
+        if parent is not None:
+            query += f" AND [System.Parent] = {int(parent)}"
+        claimed = set(state.created.values())
+        found = [item["id"] for item in client.get_work_items_from_wiql(wiql={"query": query})["workItems"]
+                 if item["id"] not in claimed]
+        if len(found) > 1:
+            logger.error(f"Plan item {key} {node.title} matches work items {found} - record the right id under "
+                         f"\"created\" in {state.path} or remove {key} from \"pending\" to create it again")
+            ambiguous.append(key)
+            continue
+        if found:
+            state.created[key] = found[0]
+        state.pending.pop(key)
+    state.save()
+    return ambiguous
+
+
+def create_ado_work_items_from_file(run_args):
+    """
+    Creates every work item in a YAML/CSV plan through the $batch endpoint
+    Each level of the tree is created in concurrent batches of up to BATCH_MAXIMUM once its parents exist
+    Progress is checkpointed to a state file so a failed run can be re-run without creating duplicates
+    """
+    import requests
+    from src.azureapi import BATCH_MAXIMUM
+    from src.metadata import validate
+    from src.plan import load_plan, PlanState
+
+    try:
+        with profiling.span("load_plan"):
+            nodes = load_plan(run_args["from_file"], default_type=run_args.get("wit") or "Task")
+    except (OSError, ValueError) as ex:
+        logger.error(f"Invalid plan file {run_args['from_file']}: {ex}")
+        return 1
+
+    client = get_client(run_args)
+    # Fields set on an item override the configured defaults so both are checked
+    error = validate(run_args, client, work_item_types=dict.fromkeys(node.work_item_type for node in nodes),
+                     area_paths=[run_args.get("areaPath"), *(node.fields.get("System.AreaPath") for node in nodes)],
+                     iterations=[run_args.get("iteration"),
+                                 *(node.fields.get("System.IterationPath") for node in nodes)])
+    states = {}
+    for node in nodes:
+        if node.fields.get("System.State"):
+            states.setdefault(node.work_item_type, {})[node.fields["System.State"]] = None
+    for work_item_type, type_states in states.items():
+        # Each State must be one its item's Work Item Type allows
+        error = error or validate(run_args, client, work_item_types=[work_item_type], states=type_states)
+    if error:
+        logger.error(error)
+        return 1
+    state = PlanState(run_args.get("state_file") or f"{run_args['from_file']}.state.json")
+    if state.pending and recover_pending(client, state, nodes):
+        return 1
+    if state.created:
+        logger.info(f"Resuming from {state.path} - {len(state.created)} work items already created")
+
+    defaults = {"System.AreaPath": run_args.get("areaPath"), "System.AssignedTo": run_args.get("username"),
+                "System.IterationPath": run_args.get("iteration")}
+    failed = set()
+    created = 0
+
+    for level in range(max((node.level for node in nodes), default=-1) + 1):
+        ready = []
+        for node in nodes:
+            if node.level != level or node.key in state.created:
+                continue
+            if node.parent_key is not None and node.parent_key not in state.created:
+                logger.error(f"Skipping {node.key} {node.title} - parent {node.parent_key} was not created")
+                failed.add(node.key)
+                continue
+            ready.append(node)
+        if not ready:
+            continue
+
+        chunks = [ready[i: i + BATCH_MAXIMUM] for i in range(0, len(ready), BATCH_MAXIMUM)]
+        state.mark_pending([node.key for node in ready])
+
+        def send(chunk):
+            operations = []
+            for node in chunk:
+                fields = {field: value for field, value in defaults.items() if value is not None}
+                fields.update({"System.Title": node.title, "System.Description": node.description, **node.fields})
+                parent = state.created[node.parent_key] if node.parent_key is not None else node.parent_id
+                operations.append(client.create_operation(node.work_item_type,
+                                                          build_create_body(client, fields, parent)))
+            return client.batch(operations)
+
+        with ThreadPoolExecutor(max_workers=min(client.max_workers, len(chunks))) as executor:
+            futures = {executor.submit(send, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    results = future.result()
+                except requests.RequestException as ex:
+                    # Outcome unknown - the keys stay pending and are looked up on the next run
+                    logger.error(f"Batch of {len(chunk)} creates failed: {ex}")
+                    failed.update(node.key for node in chunk)
+                    record_writes(run_args, client, [])
+                    continue
+                chunk_created, chunk_failed = {}, []
+                for node, result in zip(chunk, results):
+                    if result["code"] == 200:
+                        chunk_created[node.key] = result["body"]["id"]
+                        print_created(run_args, result["body"])
+                    else:
+                        logger.error(f"Failed to create {node.key} {node.title}: HTTP {result['code']} "
+                                     f"{result['body'].get('message', '')}")
+                        chunk_failed.append(node.key)
+                record_writes(run_args, client, [result["body"] for result in results if result["code"] == 200])
+                state.record(chunk_created, chunk_failed)
+                created += len(chunk_created)
+                failed.update(chunk_failed)
+
+    print(f"\nCreated {created} Work Items. {len(state.created)} of {len(nodes)} in plan done. State saved to {state.path}")
+    if failed:
+        print(f"{len(failed)} Work Items failed - fix and re-run the same command to resume")
+        return 1
+
+
 def open_ado_work_item(run_args):
     open_url = f"https://dev.azure.com/{run_args['organization']}/{run_args['project']}/_workitems/edit/{run_args['ID']}"
     print(f"OPEN {run_args['ID']} {open_url}")
@@ -177,43 +591,137 @@ def open_ado_work_item(run_args):
         os.system(f"{run_args['browser']} {open_url} & disown")
 
 
-def move_ado_work_item(run_args):
+def parse_move_targets(run_args, with_state: bool = True):
+    """
+    Splits the positional `ID [ID ...] state [comment]` arguments of move/close
+    close takes its state from --state so only `ID [ID ...] [comment]` are positional
+    :return: Tuple of (ids, state, comment)
+    """
+    targets = list(run_args.get("targets") or [])
+    ids = []
+    while targets and targets[0].isdigit():
+        ids.append(int(targets.pop(0)))
+    state = run_args.get("state")
+    if with_state:
+        if not targets:
+            raise ValueError("A Work Item State to move to is required")
+        state = targets.pop(0)
+    comment = targets.pop(0) if targets else None
+    if targets:
+        raise ValueError(f"Unexpected arguments {targets}")
+    return ids, state, comment
+
+
+def move_ado_work_item(run_args, with_state: bool = True):
     logger.debug(run_args)
     if os.environ.get("PAT_TOKEN") is None:
         logger.info("PAT_TOKEN must be set in the environment")
         return
 
+    try:
+        ids, state, comment = parse_move_targets(run_args, with_state=with_state)
+    except ValueError as ex:
+        logger.error(ex)
+        return 1
+
     work_item_update_body = [
         {
             "op": "add",
             "path": "/fields/System.State",
-            "value": run_args['state'],
+            "value": state,
         }
     ]
 
-    if run_args["comment"]:
+    if comment:
         work_item_update_body.append({
             "op": "add",
             "path": "/fields/System.History",
-            "value": run_args["comment"]
+            "value": comment
         })
 
-    update_url = f"https://dev.azure.com/{run_args['organization']}/{run_args['project']}/_apis/wit/workitems/{run_args['ID']}"
-    res = update_work_item(url=update_url, work_item_update_body=work_item_update_body)
-    print(f"{res['id']} state set to {res['fields']['System.State']}")
+    from src.azureapi import build_wiql
+    from src.metadata import validate
+
+    client = get_client(run_args)
+    error = validate(run_args, client, states=[state, run_args.get("from_state")],
+                     area_paths=[run_args.get("filter_area_path")], iterations=[run_args.get("filter_iteration")])
+    if error:
+        logger.error(error)
+        return 1
+    filtered = any(run_args.get(key) for key in ["filter_iteration", "filter_area_path", "from_state"])
+    if filtered:
+        _, windows = client.query_ids(wiql=build_wiql(
+            area_path=run_args.get("filter_area_path"), iteration=run_args.get("filter_iteration"),
+            assigned_to=None if run_args.get("allusers") else run_args.get("username"),
+            state=run_args.get("from_state")))
+        explicit = set(ids)
+        ids += [work_item_id for work_item_id in chain.from_iterable(windows) if work_item_id not in explicit]
+
+    if not ids:
+        logger.error("No Work Items matched")
+        return 1
+
+    if len(ids) == 1 and not filtered:
+        import requests
+        try:
+            res = client.update_work_item(url=client.work_item_url(ids[0]), work_item_update_body=work_item_update_body)
+        except requests.RequestException as ex:
+            # Reported through the summary below like a failed batch operation
+            results = [failed_result(ex)]
+        else:
+            record_writes(run_args, client, [res])
+            print(f"{res['id']} state set to {res['fields']['System.State']}")
+            return
+    else:
+        results = client.batch_all([client.update_operation(work_item_id, work_item_update_body)
+                                    for work_item_id in ids])
+    # A $batch call that failed outright (code None) may or may not have been applied
+    record_writes(run_args, client, [result["body"] for result in results if result["code"] == 200],
+                  unknown_ids=[work_item_id for work_item_id, result in zip(ids, results) if result["code"] is None])
+    summary = []
+    failed = 0
+    for work_item_id, result in zip(ids, results):
+        if result["code"] == 200:
+            summary.append([work_item_id, "OK", result["body"]["fields"]["System.State"]])
+        else:
+            failed += 1
+            summary.append([work_item_id, "FAILED", f"HTTP {result['code']} {result['body'].get('message', '')}"])
+    print(tabulate(summary, headers=["ID", "Result", "State"], tablefmt=run_args.get('tablefmt', "simple")))
+    print(f"\n{len(ids) - failed} of {len(ids)} Work Items set to {state}")
+    if failed:
+        return 1
+
+
+def failed_result(ex) -> dict:
+    """
+    :param ex: requests.RequestException raised by a single request
+    :return: {"code": int, "body": dict} like a failed $batch operation - code None when no response was received
+    """
+    response = getattr(ex, "response", None)
+    if response is None:
+        return {"code": None, "body": {"message": str(ex)}}
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    return {"code": response.status_code, "body": body if isinstance(body, dict) else {"message": str(ex)}}
 
 
 def close_ado_work_item(run_args):
     # Alias for `ado move Done`
-    move_ado_work_item(run_args)
+    return move_ado_work_item(run_args, with_state=False)
 
 
-def print_card(work_item):
-    from bs4 import BeautifulSoup
+@profiling.traced("print_card")
+def print_card(client, work_item, cache=None, comment_json=None):
+    """
+    :param comment_json: Comments already fetched for the work item. Fetched here if not passed
+    """
+    from src.htmltext import html_to_text
 
     fields = work_item['fields']
 
-    output = "\n" + tabulate.tabulate([
+    output = "\n" + tabulate([
         [color(bold(italic('ID:')), B), fields['System.Id'], color(bold(italic('Type:')), B),
          fields['System.WorkItemType']],
         [color(bold(italic('State:')), B), fields['System.State'], color(bold(italic('Area:')), B),
@@ -225,43 +733,376 @@ def print_card(work_item):
     output += f"\n\n{color(bold(fields['System.Title']), Y)}\n"
 
     output += f"\n{color(underline(italic(bold('Description:'))), B)}"
-    output += "\n" + BeautifulSoup(fields.get('System.Description', ''), features='html.parser').get_text(
-        '\n').strip() + "\n"
+    output += "\n" + html_to_text(fields.get('System.Description', '')).strip() + "\n"
 
     if 'Microsoft.VSTS.Common.AcceptanceCriteria' in fields:
         output += f"\n{color(underline(italic(bold('Acceptance Criteria:'))), B)}"
-        output += "\n" + BeautifulSoup(fields.get('Microsoft.VSTS.Common.AcceptanceCriteria', ''),
-                                       features='html.parser').get_text('\n').strip() + "\n"
+        output += "\n" + html_to_text(fields.get('Microsoft.VSTS.Common.AcceptanceCriteria', '')).strip() + "\n"
 
     if 'System.CommentCount' in fields and fields['System.CommentCount'] == 0:
         print(output)
         return
 
-    comment_json = get_comments(work_item['_links']['workItemComments']['href'])
+    if comment_json is None:
+        comment_json = get_work_item_comments(client, work_item, cache)
     output += f"\n{color(underline(italic(bold('Comments:'))), B)}\n"
     comment_out = []
 
     for comment in comment_json['comments'][::-1]:
-        comment_out.append([color(bold(comment['revisedBy']['uniqueName']), Y),
-                            BeautifulSoup(comment.get('text', ''), features='html.parser').get_text('\n')])
-    output += tabulate.tabulate(comment_out, tablefmt="plain")
+        comment_out.append([color(bold(comment['revisedBy']['uniqueName']), Y), html_to_text(comment.get('text', ''))])
+    output += tabulate(comment_out, tablefmt="plain")
     print(output)
 
 
+def get_work_item_comments(client, work_item, cache=None):
+    """
+    :return: Comments json for the work item - from the cache when stored at the items current revision
+    """
+    comment_json = cache.get_comments(client.organization, work_item['id'], work_item['rev']) if cache else None
+    if comment_json is None:
+        comment_url = work_item.get('_links', {}).get('workItemComments', {}).get('href')
+        comment_json = client.get_comments(comment_url or client.comments_url(work_item['id']))
+        if cache:
+            cache.put_comments(client.organization, work_item['id'], work_item['rev'], comment_json)
+    return comment_json
+
+
 def read_ado_work_item(run_args):
-    work_items = get_work_items_batch(organization=run_args['organization'],
-                                      project_name=run_args['project'], source_ids=[run_args['ID']])
+    import requests
+    from src.cache import open_cache, DEFAULT_CACHE_TTL
+
+    client = get_client(run_args)
+    cache = open_cache(run_args)
+    as_json = run_args.get("json") or run_args.get("ndjson")
+    ids = list(dict.fromkeys(run_args.get('ID') or []))
+    if run_args.get("from_query"):
+        found_items = client.get_work_items_from_wiql(wiql={"query": run_args["from_query"]})
+        ids += [elem["id"] for elem in found_items["workItems"] if elem["id"] not in ids]
+    if not ids:
+        logger.error("No Work Item IDs passed or matched by --from-query")
+        return 1
+
+    # --json outputs the full work item - the card only renders CARD_FIELDS
+    projection = FULL_PROJECTION if as_json else Projection(fields=CARD_FIELDS, relations=False)
+    work_items = {}
+    comments = {}
+    if cache is not None and not run_args.get("force"):
+        work_items = cache.get_work_items(client.organization, ids,
+                                          max_age=run_args.get("cacheTtl", DEFAULT_CACHE_TTL), projection=projection)
+    missing = [i for i in ids if i not in work_items]
+    if missing:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # A single work items comments are requested alongside it rather than after it
+            prefetch = None if as_json or len(missing) > 1 else \
+                executor.submit(client.get_comments, client.comments_url(missing[0]))
+            if projection.fields is None:
+                fetched = client.get_work_items_batch(source_ids=missing, expand="All")
+            else:
+                fetched = client.get_work_items_batch(source_ids=missing, **batch_args(projection))
+            fetched = [item for item in fetched if item is not None]
+            if prefetch is not None and fetched:
+                try:
+                    comments[fetched[0]['id']] = prefetch.result()
+                except requests.RequestException as ex:
+                    logger.debug(f"Comments not fetched: {ex}")
+        if cache is not None:
+            cache.put_work_items(client.organization, fetched, projection=projection)
+        work_items.update({item['id']: item for item in fetched})
 
     logger.debug(work_items)
-    if len(work_items) == 0 or work_items[0] is None:
-        logger.error(f"No Valid Work Item found for ID {run_args['ID']}")
+    not_found = [i for i in ids if i not in work_items]
+    for work_item_id in not_found:
+        logger.error(f"No Valid Work Item found for ID {work_item_id}")
+    found = [work_items[i] for i in ids if i in work_items]
+
+    if run_args.get("color", False):
+        global COLOR_ENABLED
+        COLOR_ENABLED = True
+
+    if as_json:
+        if run_args.get("ndjson"):
+            for work_item in found:
+                print(json.dumps(work_item))
+        else:
+            # Always an array whatever the number of ids passed or found
+            print(json.dumps(found, indent=2))
+        return 1 if not_found else None
+
+    comments = load_comments(client, cache, found, comments)
+    for work_item in found:
+        print_card(client, work_item, cache=cache, comment_json=comments.get(work_item['id']))
+    if not_found:
+        return 1
+
+
+def load_comments(client, cache, work_items, comments):
+    """
+    Loads the comments of every work item with System.CommentCount > 0 - cached threads are reused and the
+    rest are fetched concurrently
+    :param comments: Comments already fetched - id -> comments json
+    :return: Dict of id -> comments json
+    """
+    needed = {item['id']: item for item in work_items if item['fields'].get('System.CommentCount') != 0}
+    fetched = {work_item_id: comments[work_item_id] for work_item_id in needed if work_item_id in comments}
+    to_fetch = []
+    for work_item_id, item in needed.items():
+        if work_item_id in fetched:
+            continue
+        cached = cache.get_comments(client.organization, work_item_id, item['rev']) if cache else None
+        if cached is not None:
+            comments[work_item_id] = cached
+        else:
+            to_fetch.append(item)
+
+    def fetch(item):
+        comment_url = item.get('_links', {}).get('workItemComments', {}).get('href')
+        return client.get_comments(comment_url or client.comments_url(item['id']))
+
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=min(client.max_workers, len(to_fetch))) as executor:
+            fetched.update(zip((item['id'] for item in to_fetch), executor.map(fetch, to_fetch)))
+    comments.update(fetched)
+
+    if cache:
+        for work_item_id, comment_json in fetched.items():
+            cache.put_comments(client.organization, work_item_id, needed[work_item_id]['rev'], comment_json)
+    return comments
+
+
+def stats_ado_work_items(run_args):
+    """
+    Counts work items grouped by --by through the Analytics OData endpoint
+    Only the aggregate rows are downloaded - one request however many work items match
+    """
+    logger.debug(run_args)
+    if os.environ.get("PAT_TOKEN") is None:
+        logger.info("PAT_TOKEN must be set in the environment")
         return
 
+    import requests
+    from src.azureapi import build_analytics_apply, analytics_property, odata_value, CLOSED_STATES
+
+    group_by = [name.strip() for name in (run_args.get("by") or "State").split(",") if name.strip()]
+    sums = [name.strip() for name in (run_args.get("sum") or "").split(",") if name.strip()]
+    apply = build_analytics_apply(
+        group_by, area_path=None if run_args.get("all") else run_args.get("areaPath"),
+        assigned_to=None if run_args.get("allusers") else run_args.get("username"),
+        iteration=run_args.get("filter_iteration"), exclude_states=CLOSED_STATES if run_args.get("open") else None,
+        sums=sums)
+    logger.debug(apply)
+
+    client = get_client(run_args)
+    try:
+        rows = client.get_analytics(apply)
+    except requests.RequestException as ex:
+        logger.error(f"Analytics query failed: {ex}")
+        return 1
+
+    keys = [analytics_property(name) for name in group_by]
+    aliases = [analytics_property(name).replace("/", "") for name in sums]
+    groups = sorted((([odata_value(row, key) for key in keys], row) for row in rows),
+                    key=lambda group: [(value is None, str(value)) for value in group[0]])
+    if run_args.get("json"):
+        print(json.dumps([{**dict(zip(group_by, values)), "Count": row["Count"],
+                           **{name: row.get(alias) for name, alias in zip(sums, aliases)}}
+                          for values, row in groups], indent=2))
+        return
+
+    table = [[value if value is not None else "" for value in values] + [row["Count"]] +
+             [row.get(alias) or 0 for alias in aliases] for values, row in groups]
+    total = sum(row["Count"] for row in rows)
+    table.append(["Total"] + [""] * (len(keys) - 1) + [total] +
+                 [sum(row.get(alias) or 0 for row in rows) for alias in aliases])
+    print(tabulate(table, headers=group_by + ["Count"] + sums, tablefmt=run_args.get('tablefmt', "simple")))
+    print(f"\n{total} Work Items in {len(rows)} groups")
+
+
+def export_ado_work_items(run_args):
+    """
+    Exports every work item revision through the reporting revisions api - resumable from a checkpoint
+    """
+    logger.debug(run_args)
+    if os.environ.get("PAT_TOKEN") is None:
+        logger.info("PAT_TOKEN must be set in the environment")
+        return
+
+    import requests
+    from src.export import export_revisions
+
+    fields = [name.strip() for name in (run_args.get("fields") or "").split(",") if name.strip()] or None
+    client = get_client(run_args)
+    try:
+        count = export_revisions(client, run_args["output"], output_format=run_args.get("export_format") or "ndjson",
+                                 fields=fields, compress=True if run_args.get("gzip") else None,
+                                 checkpoint_path=run_args.get("checkpoint"), start_date=run_args.get("since"),
+                                 latest_only=run_args.get("latest_only", False))
+    except (ValueError, OSError) as ex:
+        logger.error(ex)
+        return 1
+    except requests.RequestException as ex:
+        logger.error(f"Export interrupted - rerun the same command to resume: {ex}")
+        return 1
+    logger.info(f"Exported {count} revisions to {run_args['output']}")
+
+
+def poll_changes(client, wiql_filters: dict, watermark: str, known: dict, projection):
+    """
+    One cheap delta poll - only ids changed after the watermark are queried and downloaded
+    Items that changed but no longer match the filters (closed, reassigned, moved) are reported as removed
+    :param known: Id -> work item of the rows currently shown
+    :return: Tuple of (new watermark, {id: work item} added, {id: work item} changed, set of removed ids)
+    """
+    from src.azureapi import build_wiql, FailedChunk
+
+    # Every item of the project touched since the watermark, matching or not. Its asOf is the next watermark so
+    # anything changed while this poll runs is seen again by the next one
+    as_of, touched = client.query_ids({"query": f"Select [System.Id] From WorkItems "
+                                                f"Where [System.TeamProject] = @project "
+                                                f"AND [System.ChangedDate] > '{watermark}'"})
+    touched = set(chain.from_iterable(touched))
+    matching = []
+    if touched:
+        _, windows = client.query_ids(build_wiql(**wiql_filters, changed_since=watermark))
+        matching = list(chain.from_iterable(windows))
+
+    added, changed = {}, {}
+    for chunk in client.iter_work_items_batch(source_ids=matching, **batch_args(projection)) if matching else []:
+        if isinstance(chunk, FailedChunk):
+            # Poll again from the same watermark rather than missing the changes
+            raise chunk.error
+        for item in chunk:
+            if item["id"] not in known:
+                added[item["id"]] = item
+            elif item["rev"] != known[item["id"]]["rev"]:
+                changed[item["id"]] = item
+    removed = {i for i in touched & known.keys() if i not in matching}
+    return as_of or watermark, added, changed, removed
+
+
+def watch_ado_work_items(run_args):
+    """
+    Live view of `ado list` - redraws the table in place whenever a poll finds added, changed or removed items
+    The poll interval doubles while nothing changes, up to watchMaxInterval, and resets on the next change
+    """
+    import requests
+    from src.azureapi import build_wiql
+    from src.table import fast_table, fit_column, terminal_size
+
+    logger.debug(run_args)
+    if os.environ.get("PAT_TOKEN") is None:
+        logger.info("PAT_TOKEN must be set in the environment")
+        return
+
+    wiql_filters = {"area_path": None if run_args["all"] else run_args["areaPath"],
+                    "assigned_to": None if run_args.get("allusers") else run_args["username"]}
+    found_for = wiql_filters["assigned_to"] or "all users"
+    try:
+        columns = parse_columns(run_args.get("columns"), tags=run_args.get("tags", False))
+    except ValueError as ex:
+        logger.error(ex)
+        return 1
+    projection = project_fields(columns)
+    headers = [column_header(col) for col in columns]
+    interval = min_interval = float(run_args.get("interval") or DEFAULT_WATCH_INTERVAL)
+    max_interval = max(float(run_args.get("max_interval") or DEFAULT_WATCH_MAX_INTERVAL), min_interval)
+
+    client = get_client(run_args)
+    as_of, windows = client.query_ids(build_wiql(**wiql_filters))
+    known = {item["id"]: item for item in client.get_work_items_batch(source_ids=list(chain.from_iterable(windows)),
+                                                                      **batch_args(projection))}
+    watermark = as_of or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    added, changed, removed = {}, {}, {}
     if run_args.get("color", False):
         global COLOR_ENABLED
         COLOR_ENABLED = True
 
+    def draw():
+        items = sorted({**known, **removed}.items())
+        rows = [build_row(item, columns) for _, item in items]
+        size = terminal_size()
+        # Highlights only go to a terminal with colour enabled
+        colored = COLOR_ENABLED and size is not None
+
+        def paint(colour, text):
+            return f"{colour}{text}{W}" if colored else text
+
+        if size is not None:
+            # Redraw in place
+            print("\033[H\033[2J", end="")
+            if "Title" in headers:
+                fit_column(rows, headers, headers.index("Title"), size.columns)
+        highlights = {**{i: G for i in added}, **{i: Y for i in changed}, **{i: R for i in removed}}
+        print("\n".join(fast_table(rows, headers, [highlights.get(i, W) for i, _ in items] if colored else None)))
+        print(f"\n{len(known)} Work Items Found for {found_for} at {datetime.now():%H:%M:%S} - "
+              f"{paint(G, f'+{len(added)} added')}, {paint(Y, f'~{len(changed)} changed')}, "
+              f"{paint(R, f'-{len(removed)} removed')}. Polling every {interval:g}s - Ctrl+C to stop", flush=True)
+
+    draw()
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                watermark, new, updated, gone = poll_changes(client, wiql_filters, watermark, known, projection)
+            except (requests.RequestException, ConnectionError) as ex:
+                interval = min(interval * 2, max_interval)
+                logger.warning(f"Poll failed - retrying in {interval:g}s: {ex}")
+                continue
+            if not (new or updated or gone):
+                interval = min(interval * 2, max_interval)
+                continue
+            interval = min_interval
+            added, changed = new, updated
+            removed = {i: known.pop(i) for i in gone}
+            known.update(new)
+            known.update(updated)
+            draw()
+    except KeyboardInterrupt:
+        return 0
+
+
+def search_ado_work_items(run_args):
+    """
+    Searches the local full-text index of work items without any network calls
+    --update first downloads the work items changed since the last update into the index
+    """
+    import sqlite3
+    from src.search import open_search_index, update_index, DEFAULT_SEARCH_LIMIT
+    from src.table import page
+
+    logger.debug(run_args)
+    try:
+        index = open_search_index(run_args)
+    except sqlite3.Error as ex:
+        logger.error(f"Search index unavailable - SQLite with FTS5 is required: {ex}")
+        return 1
+
+    if run_args.get("update") or run_args.get("force"):
+        if os.environ.get("PAT_TOKEN") is None:
+            logger.info("PAT_TOKEN must be set in the environment")
+            return
+        with profiling.span("update index"):
+            indexed = update_index(index, get_client(run_args), force=run_args.get("force", False))
+        logger.info(f"Indexed {indexed} changed Work Items - {index.count()} in {index.path}")
+        if not run_args.get("query") and not run_args.get("tag"):
+            return
+    if index.count() == 0:
+        logger.info("The search index is empty - build it with `ado search --update`")
+        return 1
+
+    with profiling.span("search"):
+        results = index.search(run_args.get("query"), tags=run_args.get("tag") or [], state=run_args.get("state"),
+                               work_item_type=run_args.get("type"), area_path=run_args.get("filter_area_path"),
+                               organization=run_args["organization"], project=run_args["project"],
+                               limit=run_args.get("limit") or DEFAULT_SEARCH_LIMIT)
     if run_args.get("json"):
-        print(work_items[0])
+        print(json.dumps(results, indent=2))
         return
-    print_card(work_items[0])
+
+    if run_args.get("color", False):
+        global COLOR_ENABLED
+        COLOR_ENABLED = True
+    rows = [[str(result["id"]), result["type"] or "", result["title"] or "", result["state"] or "",
+             result["tags"] or ""] for result in results]
+    table = render_table(rows, [result["type"] for result in results], ["ID", "Type", "Title", "State", "Tags"],
+                         run_args)
+    page(f"{table}\n\n{len(results)} Work Items Found", run_args)
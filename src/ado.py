@@ -1,32 +1,81 @@
 import argparse
+import copy
+import json
 import logging
 import os
-import yaml
 import sys
 import platform
-
-from src.actions import create_ado_work_items, open_ado_work_item, list_ado_work_items, close_ado_work_item, \
-    move_ado_work_item, read_ado_work_item
+import time
 
 logger = logging.getLogger(__name__)
 
+if platform.system() == "Windows":
+    ADO_DIR = f"{os.environ['UserProfile']}/.ado"
+else:
+    ADO_DIR = os.path.expanduser("~/.ado")
+
 if os.environ.get("ADO_CONFIG_FILE", None) is not None:
     ADO_CONFIG_FILE = os.environ["ADO_CONFIG_FILE"]
     if ADO_CONFIG_FILE.startswith("~/"):
         ADO_CONFIG_FILE = os.path.expanduser(ADO_CONFIG_FILE)
 else:
-    if platform.system() == "Windows":
-        ADO_CONFIG_FILE = f"{os.environ['UserProfile']}/.ado/.ado-config.yml"
-    else:
-        ADO_CONFIG_FILE = os.path.expanduser("~/.ado/.ado-config.yml")
+    ADO_CONFIG_FILE = f"{ADO_DIR}/.ado-config.yml"
+
+# Parsed config stored as json - loads without importing PyYAML. Invalidated when the config file changes
+ADO_CONFIG_CACHE_FILE = f"{ADO_DIR}/.ado-config.cache.json"
+# Unix socket of a running `ado daemon`
+ADO_DAEMON_SOCKET = os.environ.get("ADO_DAEMON_SOCKET", f"{ADO_DIR}/daemon.sock")
+# Subcommands that always run in the calling process - `open` launches the callers browser and `watch` would
+# hold the daemon for as long as it runs
+LOCAL_SUBCOMMANDS = {"open", "daemon", "watch"}
+
+# (mtime_ns, size, config) of the last parsed config - reused by long running processes like `ado daemon`
+_parsed_config = None
+
+
+def load_config_cache():
+    try:
+        stat = os.stat(ADO_CONFIG_FILE)
+        with open(ADO_CONFIG_CACHE_FILE) as f:
+            cached = json.load(f)
+        if cached["path"] == os.path.abspath(ADO_CONFIG_FILE) and cached["mtime_ns"] == stat.st_mtime_ns \
+                and cached["size"] == stat.st_size:
+            return cached["config"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def save_config_cache(config: dict):
+    try:
+        stat = os.stat(ADO_CONFIG_FILE)
+        os.makedirs(ADO_DIR, exist_ok=True)
+        tmp_file = f"{ADO_CONFIG_CACHE_FILE}.{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            json.dump({"path": os.path.abspath(ADO_CONFIG_FILE), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                       "config": config}, f)
+        os.replace(tmp_file, ADO_CONFIG_CACHE_FILE)
+    except (OSError, TypeError, ValueError) as ex:
+        # Config values json can't represent (e.g. yaml dates) are re-parsed every run
+        logger.debug(f"Config not cached: {ex}")
 
 
 def parse_yaml():
+    global _parsed_config
     res = {}
     try:
         if os.path.isfile(ADO_CONFIG_FILE):
-            with open(ADO_CONFIG_FILE) as f:
-                res = yaml.load(f.read(), Loader=yaml.SafeLoader)
+            stat = os.stat(ADO_CONFIG_FILE)
+            if _parsed_config is not None and _parsed_config[:2] == (stat.st_mtime_ns, stat.st_size):
+                res = copy.deepcopy(_parsed_config[2])
+            else:
+                res = load_config_cache()
+            if res is None:
+                import yaml
+                with open(ADO_CONFIG_FILE) as f:
+                    res = yaml.load(f.read(), Loader=yaml.SafeLoader) or {}
+                save_config_cache(res)
+            _parsed_config = (stat.st_mtime_ns, stat.st_size, copy.deepcopy(res))
         else:
             print(f"No config file found {ADO_CONFIG_FILE}")
     except Exception as ex:
@@ -37,12 +86,33 @@ def parse_yaml():
         return res
 
 
-def ado():
-    print('-' * 88)
-    print("Azure DevOps Work Item Management Cli")
-    print('-' * 88)
+def lazy_action(name: str, module: str = "actions"):
+    """
+    Defers importing src.actions until a subcommand runs - `ado -h` and argument errors never load it
+    """
+
+    def run(run_args):
+        import importlib
+        from src import profiling
+        with profiling.span(f"import src.{module}"):
+            action = getattr(importlib.import_module(f"src.{module}"), name)
+        with profiling.span(name):
+            return action(run_args)
+
+    return run
+
 
+def ado(use_daemon: bool = True):
+    # Hand the command to a warm `ado daemon` when one is listening
+    if use_daemon and len(sys.argv) > 1 and sys.argv[1] not in LOCAL_SUBCOMMANDS and os.path.exists(ADO_DAEMON_SOCKET):
+        from src.daemon import forward
+        code = forward(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+
+    started = time.perf_counter()
     run_args = parse_yaml()
+    config_parsed = time.perf_counter()
     logging.basicConfig(level=run_args.get("LOGLEVEL", logging.INFO), format='%(levelname)s: %(message)s')
     parser = argparse.ArgumentParser()
     # parser.add_argument('action', choices=['list', 'create', 'close'])
@@ -52,17 +122,21 @@ def ado():
 
     # CREATE SUBPARSER ARGS
     create_parser = subparsers.add_parser('create', help='create an Azure DevOps Work Item')
-    create_parser.set_defaults(func=create_ado_work_items)
+    create_parser.set_defaults(func=lazy_action("create_ado_work_items"))
 
-    create_parser.add_argument("title", help="Title of Work Item to create")
-    create_parser.add_argument("desc", help="Work Item description")
+    create_parser.add_argument("title", help="Title of Work Item to create", nargs="?", default=None)
+    create_parser.add_argument("desc", help="Work Item description", nargs="?", default=None)
     create_parser.add_argument("-wit", help="Work Items Type to create/update/list",
                                required=False, default="Task")
     create_parser.add_argument("-p", "--parent", help="ID of the parent work item", required=False, type=int)
+    create_parser.add_argument("--from-file", dest="from_file", required=False, default=None,
+                               help="YAML or CSV plan of work item trees to create in bulk")
+    create_parser.add_argument("--state-file", dest="state_file", required=False, default=None,
+                               help="Checkpoint used to resume a --from-file create. Defaults to <file>.state.json")
 
     # OPEN SUBPARSER ARGS
     open_parser = subparsers.add_parser('open', help='Opens an Azure DevOps Work Item in the browser based on ID')
-    open_parser.set_defaults(func=open_ado_work_item)
+    open_parser.set_defaults(func=lazy_action("open_ado_work_item"))
 
     open_parser.add_argument("ID", help="The ID of the Azure DevOps Work Item to Open", type=int)
     open_parser.add_argument("browser", help="browser to open in", nargs='?',
@@ -70,35 +144,164 @@ def ado():
 
     # OPEN SUBPARSER ARGS
     read_parser = subparsers.add_parser('read', help='Outputs the details of an Azure DevOps Work Item')
-    read_parser.set_defaults(func=read_ado_work_item)
-    read_parser.add_argument("ID", help="The ID of the Azure DevOps Work Item to Open", type=int)
-    read_parser.add_argument("--json", help="Outputs JSON of Work Items", required=False, action='store_true')
+    read_parser.set_defaults(func=lazy_action("read_ado_work_item"))
+    read_parser.add_argument("ID", help="IDs of the Azure DevOps Work Items to Read", type=int, nargs="*")
+    read_parser.add_argument("--from-query", dest="from_query", required=False, default=None,
+                             help="Also read every Work Item matched by this WIQL query")
+    read_parser.add_argument("--json", help="Outputs a JSON array of the Work Items found",
+                             required=False, action='store_true')
+    read_parser.add_argument("--ndjson", help="Outputs one JSON Work Item per line", required=False,
+                             action='store_true')
+    read_parser.add_argument("--force", help="Ignore the local work item cache", required=False,
+                             action='store_true')
 
     # LIST SUBPARSER ARGS
     list_parser = subparsers.add_parser("list", help="list work items assigned to current user")
-    list_parser.set_defaults(func=list_ado_work_items)
+    list_parser.set_defaults(func=lazy_action("list_ado_work_items"))
 
     list_parser.add_argument("--all", help="list work items on all area paths", required=False, action='store_true')
-    list_parser.add_argument("--allusers", help="list work items on all area paths", required=False, default=False)
+    list_parser.add_argument("--allusers", help="list work items assigned to any user", required=False,
+                             action='store_true')
     list_parser.add_argument("--tags", help="Show Tags", required=False, action='store_true')
+    list_parser.add_argument("--columns", help="Comma separated columns to show e.g. ID,Type,Title,State,Tags or "
+                                              "field reference names. Only these fields are downloaded",
+                             required=False, default=run_args.get("columns", None))
     list_parser.add_argument("-wit", help="Work Items Type to create/update/list", required=False, default='Task')
+    list_parser.add_argument("--format", help="Output format. ndjson|csv|tsv stream rows as they are downloaded",
+                             required=False, choices=["table", "ndjson", "csv", "tsv"],
+                             default=run_args.get("format", "table"))
+    list_parser.add_argument("--force", help="Full refresh of the local work item cache", required=False,
+                             action='store_true')
+    list_parser.add_argument("--projects", required=False, default=run_args.get("projects", None),
+                             help="Comma separated organization/project pairs listed concurrently into one table "
+                                  "e.g. org1/projA,org2/projC")
+
+    # WATCH SUBPARSER ARGS
+    watch_parser = subparsers.add_parser("watch", help="Live view of `ado list` that polls for changed work items")
+    watch_parser.set_defaults(func=lazy_action("watch_ado_work_items"))
+    watch_parser.add_argument("--all", help="watch work items on all area paths", required=False, action='store_true')
+    watch_parser.add_argument("--allusers", help="watch work items assigned to any user", required=False,
+                              action='store_true')
+    watch_parser.add_argument("--tags", help="Show Tags", required=False, action='store_true')
+    watch_parser.add_argument("--columns", help="Comma separated columns to show e.g. ID,Type,Title,State,Tags",
+                              required=False, default=run_args.get("columns", None))
+    watch_parser.add_argument('-ap', '--area-path', dest="areaPath", help="The Area Path to Search", required=False,
+                              default=run_args.get("areaPath", None))
+    watch_parser.add_argument("--interval", type=float, required=False, default=run_args.get("watchInterval", None),
+                              help="Seconds between polls while work items are changing")
+    watch_parser.add_argument("--max-interval", dest="max_interval", type=float, required=False,
+                              default=run_args.get("watchMaxInterval", None),
+                              help="Longest poll interval reached by backing off while nothing changes")
+
+    # SEARCH SUBPARSER ARGS
+    search_parser = subparsers.add_parser("search", help="Full-text search of a local work item index - offline")
+    search_parser.set_defaults(func=lazy_action("search_ado_work_items"))
+    search_parser.add_argument("query", nargs="?", default=None,
+                               help="Words to find in the Title, Description, Acceptance Criteria or Tags")
+    search_parser.add_argument("--tag", action="append", required=False, default=None,
+                               help="Only Work Items with this Tag. Repeat to require several")
+    search_parser.add_argument("--state", required=False, default=None, help="Only Work Items in this State")
+    search_parser.add_argument("--type", required=False, default=None, help="Only Work Items of this Type")
+    search_parser.add_argument("-ap", "--area-path", dest="filter_area_path", required=False, default=None,
+                               help="Only Work Items in this Area Path or below it")
+    search_parser.add_argument("--limit", type=int, required=False, default=None,
+                               help="Maximum results shown. Defaults to 50")
+    search_parser.add_argument("--json", help="Print the results as json", required=False, action='store_true')
+    search_parser.add_argument("--update", required=False, action='store_true',
+                               help="First download Work Items changed since the last update into the index")
+    search_parser.add_argument("--force", required=False, action='store_true',
+                               help="Rebuild the index from every Work Item in the project")
+
+    # STATS SUBPARSER ARGS
+    stats_parser = subparsers.add_parser("stats", help="Count work items server side grouped by fields")
+    stats_parser.set_defaults(func=lazy_action("stats_ado_work_items"))
+    stats_parser.add_argument("--by", help="Comma separated fields to group by e.g. State,WorkItemType,IterationPath",
+                              required=False, default=run_args.get("statsBy", "State"))
+    stats_parser.add_argument("--sum", help="Comma separated numeric fields to total per group e.g. RemainingWork",
+                              required=False, default=None)
+    stats_parser.add_argument("--all", help="count work items on all area paths", required=False,
+                              action='store_true')
+    stats_parser.add_argument("--allusers", help="count work items assigned to any user", required=False,
+                              action='store_true')
+    stats_parser.add_argument("--open", help="only count work items that are not closed", required=False,
+                              action='store_true')
+    stats_parser.add_argument('-ap', '--area-path', dest="areaPath", help="The Area Path to count", required=False,
+                              default=run_args.get("areaPath", None))
+    stats_parser.add_argument("-it", "--iteration", dest="filter_iteration", required=False, default=None,
+                              help="only count work items in this Iteration")
+    stats_parser.add_argument("--json", help="Outputs JSON of the groups", required=False, action='store_true')
+
+    # EXPORT SUBPARSER ARGS
+    export_parser = subparsers.add_parser("export", help="Export every work item revision to a file - resumable")
+    export_parser.set_defaults(func=lazy_action("export_ado_work_items"))
+    export_parser.add_argument("output", help="File to write. Gzipped when it ends in .gz")
+    export_parser.add_argument("--format", dest="export_format", required=False, default="ndjson",
+                               choices=["ndjson", "csv"], help="ndjson writes whole revisions, csv the --fields")
+    export_parser.add_argument("--fields", required=False, default=None,
+                               help="Comma separated field reference names to export e.g. System.Id,System.State")
+    export_parser.add_argument("--gzip", help="Gzip the output", required=False, action='store_true')
+    export_parser.add_argument("--since", required=False, default=None,
+                               help="Only export revisions made after this date e.g. 2024-01-01")
+    export_parser.add_argument("--latest-only", dest="latest_only", required=False, action='store_true',
+                               help="Only export the latest revision of each work item")
+    export_parser.add_argument("--checkpoint", required=False, default=None,
+                               help="Checkpoint used to resume the export. Defaults to <output>.checkpoint.json")
 
     # CLOSE SUBPARSER ARGS
-    close_parser = subparsers.add_parser("close", help="Close an Azure DevOps Work Item")
-    close_parser.set_defaults(func=close_ado_work_item)
-    close_parser.add_argument("ID", help="The ID of the Azure DevOps Work Item to Close", type=int)
-    close_parser.add_argument("comment", help="Optional closing comment to add to Work Item", nargs="?", default=None)
+    close_parser = subparsers.add_parser("close", help="Close Azure DevOps Work Items")
+    close_parser.set_defaults(func=lazy_action("close_ado_work_item"))
+    close_parser.add_argument("targets", nargs="*", metavar="ID [ID ...] [comment]",
+                              help="IDs of the Azure DevOps Work Items to Close followed by an optional closing "
+                                   "comment to add to each Work Item")
     close_parser.add_argument("--state", help="Optional State of move work item too. Defaults to Done", required=False,
                               default="Done")
 
     # MOVE SUBPARSER ARGS
-    move_parser = subparsers.add_parser("move", help="Change an Azure DevOps Work Items State")
-    move_parser.set_defaults(func=move_ado_work_item)
-    move_parser.add_argument("ID", help="The ID of the Azure DevOps Work Item to Close", type=int)
-    move_parser.add_argument("state", help="The Work Item State to move too. Must be a valid state")
-    move_parser.add_argument("comment", help="Optional comment to add to Work Item", nargs="?", default=None)
+    move_parser = subparsers.add_parser("move", help="Change Azure DevOps Work Items State")
+    move_parser.set_defaults(func=lazy_action("move_ado_work_item"))
+    move_parser.add_argument("targets", nargs="+", metavar="ID [ID ...] state [comment]",
+                             help="IDs of the Azure DevOps Work Items to move, the Work Item State to move too "
+                                  "(must be a valid state) and an optional comment to add to each Work Item")
+
+    for subparser in [close_parser, move_parser]:
+        # Select Work Items by query instead of or as well as by ID
+        subparser.add_argument("-it", "--iteration", dest="filter_iteration", required=False, default=None,
+                               help="Also update every open Work Item in this Iteration")
+        subparser.add_argument("-ap", "--area-path", dest="filter_area_path", required=False, default=None,
+                               help="Also update every open Work Item in this Area Path")
+        subparser.add_argument("--from-state", dest="from_state", required=False, default=None,
+                               help="Also update every Work Item currently in this State")
+        subparser.add_argument("--allusers", help="Match Work Items assigned to any user with the filters above",
+                               required=False, action='store_true')
+
+    # DAEMON SUBPARSER ARGS
+    daemon_parser = subparsers.add_parser("daemon", help="Run ado commands in a warm background process")
+    daemon_parser.set_defaults(func=lazy_action("daemon_command", module="daemon"))
+    daemon_parser.add_argument("action", nargs="?", default="status", choices=["start", "stop", "status", "run"],
+                               help="start/stop the background daemon, show its status or run it in the foreground")
 
-    for subparser in [create_parser, list_parser, close_parser]:
+    # COMPLETION SUBPARSER ARGS
+    completion_parser = subparsers.add_parser("completion", help="Shell completion script e.g. "
+                                                                 "eval \"$(ado completion bash)\"")
+    # format keeps the banner out of the script
+    completion_parser.set_defaults(func=lazy_action("completion_command", module="metadata"), format="script",
+                                   commands=subparsers.choices)
+    completion_parser.add_argument("shell", nargs="?", default="bash", choices=["bash", "zsh"],
+                                   help="Shell to print the completion script for")
+    completion_parser.add_argument("--list", required=False, default=None,
+                                   help="Print the words completed for comma separated kinds - commands, ids, types, "
+                                        "states, areas or iterations - from local data only")
+    completion_parser.add_argument("--prefix", required=False, default="",
+                                   help="Only list words starting with this prefix")
+    completion_parser.add_argument("--refresh", required=False, action='store_true',
+                                   help="Download the projects Work Item Types, States, Area Paths and Iterations")
+    completion_parser.add_argument('-o', '--org', dest="organization", help="Azure DevOps Organization",
+                                   required=False, default=run_args.get("organization", None))
+    completion_parser.add_argument('-proj', '--project', dest="project", help="Azure DevOps Project Name",
+                                   required=False, default=run_args.get("project", None))
+
+    for subparser in [create_parser, list_parser, watch_parser, search_parser, stats_parser, export_parser,
+                      close_parser, move_parser]:
         # Add shared defaults to each subparser
         subparser.add_argument('-username', help="Email address for ADO User",
                                required=False if "username" in run_args else True,
@@ -110,6 +313,13 @@ def ado():
                                required=False if "project" in run_args else True,
                                default=run_args.get("project", None))
 
+    for subparser in [create_parser, read_parser, list_parser, search_parser, stats_parser, export_parser,
+                      close_parser, move_parser]:
+        subparser.add_argument("--profile", nargs="?", const="summary", default=run_args.get("profile", None),
+                               metavar="TRACE_FILE",
+                               help="Print phase and HTTP call timings to stderr or write a Chrome trace json to "
+                                    "TRACE_FILE e.g. --profile=trace.json")
+
     for subparser in [create_parser, list_parser]:
         subparser.add_argument('-ap', '--area-path', dest="areaPath", help="The Area Path to Search", required=False,
                                default=run_args.get("areaPath", None))
@@ -120,10 +330,31 @@ def ado():
     # Merge with config from yaml
     run_args.update(vars(args))
 
+    if run_args.get("profile"):
+        from src import profiling
+        process_started = profiling.process_started() if use_daemon else None
+        tracer = profiling.start(run_args["profile"], origin=process_started or started)
+        if process_started is not None:
+            tracer.add("interpreter startup", "phase", process_started, started)
+        tracer.add("parse_yaml", "phase", started, config_parsed)
+        tracer.add("argparse", "phase", config_parsed, time.perf_counter())
+
+    # Keep stdout clean for machine readable output
+    if run_args.get("format", "table") == "table" and not run_args.get("json") and not run_args.get("ndjson"):
+        print('-' * 88)
+        print("Azure DevOps Work Item Management Cli")
+        print('-' * 88)
+
     # Enable coloured output
     if run_args.get("color", False):
         os.system('color')
-    args.func(run_args)
+    try:
+        code = args.func(run_args)
+    finally:
+        if run_args.get("profile"):
+            from src import profiling
+            profiling.finish()
+    sys.exit(code)
 
 
 if __name__ == '__main__':
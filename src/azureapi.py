@@ -1,13 +1,23 @@
+import base64
+import json
 import logging
-import requests
 import os
-from requests.auth import HTTPBasicAuth
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import profiling
+from src.throttle import backoff, get_scheduler
 
 logger = logging.getLogger(__name__)
 
 APPLICATION_JSON_HEADERS = {
     "Accept": "application/json",
-    "Content-Typ": "application/json",
+    "Content-Type": "application/json",
 }
 APPLICATION_JSON_PATCH_HEADERS = {
     "Accept": "application/json-patch+json",
@@ -15,182 +25,609 @@ APPLICATION_JSON_PATCH_HEADERS = {
 }
 
 DEFAULT_ADO_PARAMS = {"api-version": "5.0-preview"}
+DEFAULT_BASE_URL = "https://dev.azure.com"
+DEFAULT_ANALYTICS_URL = "https://analytics.dev.azure.com"
+ANALYTICS_VERSION = "v3.0-preview"
+# `ado stats --by/--sum` names -> Analytics WorkItems properties. Other names are passed through as is
+ANALYTICS_PROPERTIES = {
+    "state": "State",
+    "type": "WorkItemType",
+    "workitemtype": "WorkItemType",
+    "iteration": "Iteration/IterationPath",
+    "iterationpath": "Iteration/IterationPath",
+    "area": "Area/AreaPath",
+    "areapath": "Area/AreaPath",
+    "assignedto": "AssignedTo/UserEmail",
+    "priority": "Priority",
+    "statecategory": "StateCategory",
+    "remainingwork": "RemainingWork",
+    "storypoints": "StoryPoints",
+    "effort": "Effort",
+}
 
 BATCH_MAXIMUM = 200
-
-
-def build_wiql(area_path: str, assigned_to: str) -> dict:
+# The WIQL endpoint fails (VS402337) when a query matches more work items than this
+WIQL_MAXIMUM = 20000
+# States excluded from `ado list`
+CLOSED_STATES = ["Done", "Removed"]
+POOL_MAXSIZE = 16
+COMMENTS_PAGE_SIZE = 200
+REVISIONS_PAGE_SIZE = 1000
+# Levels of the area and iteration trees fetched for validation and completion
+CLASSIFICATION_DEPTH = 10
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRIES = 2
+# A throttled request was never processed so it is retried after Retry-After whatever its method - up to this often
+MAX_THROTTLED_RETRIES = 8
+# Methods safe to resend after a connection failure or server error. Read only POSTs pass idempotent=True
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# One keep-alive session per (base_url, organization) shared by every AdoClient in the process
+_SESSIONS = {}
+
+
+def build_wiql(area_path: str, assigned_to: str, changed_since: str = None, iteration: str = None,
+               state: str = None) -> dict:
     """
     Wiql String Builder Helper
     :param area_path: The Area Path to Search for Work Items
-    :param assigned_to: Email of user
+    :param assigned_to: Email of user. None matches every user
+    :param changed_since: Optional ISO timestamp watermark - only match items changed after it
+    :param iteration: Optional Iteration Path to match
+    :param state: Only match items in this state. Defaults to every state except CLOSED_STATES
     :return: Dict with wiql Payload
     """
-    wiql = "Select [System.Id], [System.Title], [System.State] From WorkItems Where"
+    wiql = "Select [System.Id], [System.Title], [System.State] From WorkItems Where "
+    clauses = []
+
+    if assigned_to is not None:
+        clauses.append(f'[System.AssignedTo] == "{assigned_to}"')
+
+    if area_path is not None:
+        clauses.append(f'[System.AreaPath] == "{area_path}"')
+
+    if iteration is not None:
+        clauses.append(f'[System.IterationPath] == "{iteration}"')
+
+    if state is not None:
+        clauses.append(f'[System.State] == "{state}"')
+    else:
+        clauses += [f'[System.State] <> "{closed}"' for closed in CLOSED_STATES]
+
+    if changed_since is not None:
+        clauses.append(f"[System.ChangedDate] > '{changed_since}'")
+    return {"query": wiql + " AND ".join(clauses)}
+
+
+def analytics_property(name: str) -> str:
+    return ANALYTICS_PROPERTIES.get(name.lower(), name)
+
+
+def odata_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def odata_value(row: dict, prop: str):
+    """
+    :return: Value of a grouped property - navigation properties like Iteration/IterationPath come back nested
+    """
+    for key in prop.split("/"):
+        row = row.get(key) if isinstance(row, dict) else None
+    return row
 
-    wiql += f' [System.AssignedTo] == "{assigned_to}"'
 
+def build_analytics_apply(group_by: list, area_path: str = None, assigned_to: str = None, iteration: str = None,
+                          exclude_states: list = None, sums: list = None) -> str:
+    """
+    Analytics OData $apply String Builder Helper - counts work items server side
+    :param group_by: Properties (or ANALYTICS_PROPERTIES names) to group by
+    :param area_path: Only count work items in this Area Path
+    :param assigned_to: Only count work items assigned to this email. None counts every user
+    :param iteration: Only count work items in this Iteration Path
+    :param exclude_states: States not counted
+    :param sums: Numeric properties summed per group e.g. RemainingWork
+    :return: $apply value e.g. filter(State ne 'Done')/groupby((State), aggregate($count as Count))
+    """
+    filters = []
     if area_path is not None:
-        wiql += f'AND [System.AreaPath] == "{area_path}"'
+        filters.append(f"Area/AreaPath eq {odata_literal(area_path)}")
+    if assigned_to is not None:
+        filters.append(f"AssignedTo/UserEmail eq {odata_literal(assigned_to)}")
+    if iteration is not None:
+        filters.append(f"Iteration/IterationPath eq {odata_literal(iteration)}")
+    filters += [f"State ne {odata_literal(state)}" for state in exclude_states or []]
+
+    aggregates = ["$count as Count"]
+    for name in sums or []:
+        prop = analytics_property(name)
+        aggregates.append(f"{prop} with sum as {prop.replace('/', '')}")
+    groupby = f"groupby(({', '.join(analytics_property(name) for name in group_by)}), " \
+              f"aggregate({', '.join(aggregates)}))"
+    return f"filter({' and '.join(filters)})/{groupby}" if filters else groupby
+
+
+def window_wiql(wiql: dict, after: int = None, through: int = None, descending: bool = False) -> dict:
+    """
+    Restricts an AND-ed WIQL query to the ids in (after, through] ordered by id
+    :return: Dict with wiql Payload
+    """
+    clauses = []
+    if after is not None:
+        clauses.append(f"[System.Id] > {after}")
+    if through is not None:
+        clauses.append(f"[System.Id] <= {through}")
+    query = " AND ".join([wiql["query"], *clauses])
+    return {"query": f"{query} ORDER BY [System.Id] {'DESC' if descending else 'ASC'}"}
+
 
-    wiql += f' AND [System.State] <> "Done"'
-    wiql += f' AND [System.State] <> "Removed"'
-    return {"query": wiql}
+def chunked(iterable, size: int):
+    """
+    Yields lists of up to size items from any iterable without materialising it
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
 
 
-def get_azure_devops_work_item(work_item_url: str):
+def cached_response(not_modified: requests.Response, meta: dict, body: bytes) -> requests.Response:
     """
-    Fetches a Work Items Details the from Azure DevOps work_item_url passed
-    :param work_item_url: The url of the work item to fetch details from
-    :return:
+    :return: A 200 response for a 304 with the body stored by the http cache
     """
-    # Param to return full work item details
-    # https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/work%20items/get%20work%20item
-    request_params = {"$expand": "ALL"}
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = not_modified.url
+    resp.request = not_modified.request
+    resp.headers.update(meta["headers"])
+    resp._content = body
+    return resp
 
-    resp = requests.request(
-        method="GET",
-        url=work_item_url,
-        headers=APPLICATION_JSON_HEADERS,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        params={**DEFAULT_ADO_PARAMS, **request_params},
-    )
 
-    resp.raise_for_status()
-    return resp.json()
+def is_retryable(ex: requests.RequestException) -> bool:
+    """
+    Connection failures, throttling and server errors are worth retrying - other client errors are not
+    """
+    if isinstance(ex, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(ex, "response", None)
+    return response is not None and (response.status_code == 429 or response.status_code >= 500)
+
+
+def get_session(organization: str, token: str, base_url: str = DEFAULT_BASE_URL) -> requests.Session:
+    """
+    Returns the pooled session for an organization - creating it on first use
+    Auth and compression headers are set once on the session rather than per request
+    :param organization: Azure DevOps Organization Name
+    :param token: PAT_TOKEN used for Basic Auth
+    :param base_url: Azure DevOps host
+    :return: requests.Session
+    """
+    key = (base_url, organization)
+    if key not in _SESSIONS:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        basic_auth = base64.b64encode(f":{token}".encode()).decode()
+        session.headers.update({
+            "Authorization": f"Basic {basic_auth}",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+        _SESSIONS[key] = session
+    return _SESSIONS[key]
+
+
+class FailedChunk(list):
+    """
+    Empty chunk yielded by iter_work_items_batch for a chunk that still failed after retries
+    Callers that record a sync watermark check for it so the ids are fetched again on the next sync
+    """
+
+    def __init__(self, ids: list, error: Exception):
+        super().__init__()
+        self.ids = ids
+        self.error = error
 
 
-def get_work_items_batch(organization: str, project_name: str, source_ids: list):
+class AdoClient:
     """
-    Get Work Item Details matching the source_ids passed
-    The ids are processed in batches of max size 200
-    :param project_name:
-    :param organization:
-    :param source_ids:
-    :return: A List containing all work item details for every workitem.id=id in source_ids
+    Azure DevOps Restapi Client for a single organization/project
+    Every call goes through the organizations pooled keep-alive session
     """
-    if len(source_ids) < 1:
-        logger.error("get_source_work_item_details called on empty source_ids list")
-        return []
 
-    chunks = [
-        source_ids[i: i + BATCH_MAXIMUM]
-        for i in range(0, len(source_ids), BATCH_MAXIMUM)
-    ]
+    def __init__(self, organization: str, project_name: str, token: str = None, base_url: str = None,
+                 max_workers: int = None, retries: int = DEFAULT_RETRIES, http_cache=None,
+                 analytics_url: str = None, max_request_rate: float = None):
+        """
+        :param retries: Resends of an idempotent request after a connection failure or server error
+        :param http_cache: Optional src.httpcache.HttpCache revalidating work item and comment GET responses
+        :param analytics_url: Analytics OData host. Defaults to analytics.dev.azure.com or base_url when overridden
+        :param max_request_rate: Requests per second the organizations RequestScheduler never exceeds. None leaves
+            requests unpaced until Azure DevOps signals pressure
+        """
+        self.organization = organization
+        self.project_name = project_name
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        if analytics_url is None:
+            analytics_url = DEFAULT_ANALYTICS_URL if self.base_url == DEFAULT_BASE_URL else self.base_url
+        self.analytics_url = analytics_url.rstrip("/")
+        self.max_workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+        self.retries = retries
+        self.http_cache = http_cache
+        self.session = get_session(organization, token or os.environ["PAT_TOKEN"], self.base_url)
+        self.scheduler = get_scheduler(self.base_url, organization, max_request_rate)
+
+    @property
+    def project_url(self) -> str:
+        return f"{self.base_url}/{self.organization}/{self.project_name}"
+
+    def work_item_url(self, work_item_id) -> str:
+        return f"{self.project_url}/_apis/wit/workitems/{work_item_id}"
+
+    def request(self, method: str, url: str, headers: dict = None, params: dict = None, api_version: bool = True,
+                idempotent: bool = None, cacheable: bool = False, **kwargs):
+        """
+        Sends a request on the pooled session through the organizations RequestScheduler and raises on any HTTP error
+        A 429 is retried once the scheduler's Retry-After pause has passed. Idempotent requests are also retried
+        with jittered backoff after connection failures and server errors
+        Cacheable GETs are revalidated against the http_cache when one is set - a 304 is answered from disk
+        :param api_version: Send DEFAULT_ADO_PARAMS. The Analytics OData endpoints are versioned by path instead
+        :param idempotent: Safe to resend. Defaults to True for IDEMPOTENT_METHODS
+        :param cacheable: Keep the GET response in the http_cache. Only for responses that are requested again
+        :return: requests.Response
+        """
+        params = {**(DEFAULT_ADO_PARAMS if api_version else {}), **(params or {})}
+        headers = headers or APPLICATION_JSON_HEADERS
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        cacheable = cacheable and self.http_cache is not None and method == "GET"
+        cached = self.http_cache.lookup(url, params) if cacheable else None
+        if cached is not None:
+            headers = {**headers, **self.http_cache.validators(cached[0])}
+
+        tracer = profiling.active()
+        failures = throttles = 0
+        while True:
+            self.scheduler.acquire()
+            start = time.perf_counter() if tracer else None
+            try:
+                resp = self.session.request(method=method, url=url, headers=headers, params=params, **kwargs)
+            except requests.RequestException as ex:
+                if tracer:
+                    self._trace_call(tracer, method, url, start, type(ex).__name__, 0)
+                if idempotent and failures < self.retries and is_retryable(ex):
+                    self._retry(tracer, method, url, ex, backoff(failures))
+                    failures += 1
+                    continue
+                raise
+            if tracer:
+                self._trace_call(tracer, method, url, start, resp.status_code, len(resp.content))
+            self.scheduler.observe(resp)
+            if resp.status_code == 429 and throttles < MAX_THROTTLED_RETRIES:
+                # The scheduler holds every sender until Retry-After has passed
+                self._retry(tracer, method, url, f"HTTP 429 from {self.url_template(url)}", 0)
+                throttles += 1
+                continue
+            if resp.status_code >= 500 and idempotent and failures < self.retries:
+                self._retry(tracer, method, url, f"HTTP {resp.status_code} from {self.url_template(url)}",
+                            backoff(failures))
+                failures += 1
+                continue
+            break
+
+        if cached is not None and resp.status_code == 304:
+            self.http_cache.hit(url, params)
+            return cached_response(resp, *cached)
+        resp.raise_for_status()
+        if cacheable:
+            self.http_cache.store(url, params, resp.headers, resp.content)
+        return resp
+
+    def _retry(self, tracer, method: str, url: str, reason, delay: float):
+        self.scheduler.retrying(reason)
+        if tracer:
+            template = self.url_template(url)
+            tracer.add(f"retry {method} {template}", "retry", time.perf_counter(), method=method, url=template,
+                       error=str(reason))
+        if delay:
+            time.sleep(delay)
+
+    def _trace_call(self, tracer, method: str, url: str, start: float, status, size: int):
+        template = self.url_template(url)
+        tracer.add(f"{method} {template}", "http", start, time.perf_counter(), method=method, url=template,
+                   status=status, bytes=size)
+
+    def url_template(self, url: str) -> str:
+        """
+        :return: url without the host, organization, project or ids - groups calls in --profile output
+        """
+        path = url[len(self.base_url):] if url.startswith(self.base_url) else url
+        path = path.replace(f"/{self.organization}/{self.project_name}/", "/{org}/{project}/", 1)
+        return profiling.url_template(path.replace(f"/{self.organization}/", "/{org}/", 1))
+
+    def ordered_map(self, func, items):
+        """
+        Calls func on every item with up to max_workers threads and yields the results in item order
+        Only 2 * max_workers calls are in flight or waiting to be consumed at once so memory stays bounded
+        however many items there are
+        :return: Generator of func results
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque(executor.submit(func, item) for item in islice(items, self.max_workers * 2))
+            while pending:
+                result = pending.popleft().result()
+                pending.extend(executor.submit(func, item) for item in islice(items, 1))
+                yield result
+
+    def comments_url(self, work_item_id) -> str:
+        return f"{self.project_url}/_apis/wit/workItems/{work_item_id}/comments"
+
+    def get_work_item(self, work_item_url: str, fields: list = None):
+        """
+        Fetches a Work Items Details the from Azure DevOps work_item_url passed
+        :param work_item_url: The url of the work item to fetch details from
+        :param fields: Only return these fields. Defaults to every field, relation and link
+        :return:
+        """
+        # https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/work%20items/get%20work%20item
+        if fields:
+            return self.request("GET", work_item_url, params={"fields": ",".join(fields)}, cacheable=True).json()
+        # Param to return full work item details
+        return self.request("GET", work_item_url, params={"$expand": "ALL"}, cacheable=True).json()
+
+    def get_work_items_batch(self, source_ids: list, fields: list = None, expand: str = "All"):
+        """
+        Get Work Item Details matching the source_ids passed
+        The ids are processed in batches of max size 200 - fetched concurrently by up to max_workers threads
+        :param source_ids:
+        :param fields: Only return these fields. The api ignores expand when fields are passed
+        :param expand: None|Relations|Fields|Links|All
+        :return: A List containing all work item details for every workitem.id=id in source_ids
+        """
+        work_item_details = []
+        for chunk in self.iter_work_items_batch(source_ids, fields=fields, expand=expand):
+            work_item_details += chunk
+        return work_item_details
+
+    def iter_work_items_batch(self, source_ids, fields: list = None, expand: str = "All"):
+        """
+        Yields the Work Item Details for each chunk of source_ids in the original id order
+        Chunks are requested concurrently and yielded as soon as they and every preceding chunk have arrived
+        A chunk that still fails after retries is logged and yielded as an empty FailedChunk - the remaining chunks are
+        still returned
+        :param source_ids: List or iterable of ids - an iterable is consumed lazily as chunks are requested
+        :return: Generator of lists of work item details
+        """
+        yield from self.ordered_map(lambda chunk: self._get_work_items_chunk(chunk, fields, expand),
+                                    chunked(source_ids, BATCH_MAXIMUM))
+
+    def _get_work_items_chunk(self, chunk: list, fields: list = None, expand: str = "All") -> list:
+        """
+        Fetches a single chunk - throttling and transient failures are retried by request
+        :return: The chunks work item details or a FailedChunk if the chunk failed
+        """
+        try:
+            work_item_details_json = self._get_work_items_batch(batch_ids=chunk, fields=fields, expand=expand)
+        except requests.RequestException as ex:
+            logger.error(f"Failed to fetch work item chunk {chunk[0]}..{chunk[-1]} ({len(chunk)} ids): {ex}")
+            return FailedChunk(chunk, ex)
 
-    work_item_details = []
-    for chunk in chunks:
-        work_item_details_json = __get_work_items_batch(organization=organization,
-                                                        project_name=project_name, batch_ids=chunk)
         if work_item_details_json["count"] < 1:
             logger.error(f"No values found for work item chunk. Check usage. \n:{chunk}")
             logger.debug(work_item_details_json)
-            raise UserWarning(f"No values found for work item chunk. Check usage. \n:{chunk}")
-        work_item_details += work_item_details_json["value"]
-    return work_item_details
-
-
-def __get_work_items_batch(organization: str, project_name: str, batch_ids: list):
-    """
-    Get Work Item Details matching the source_ids passed
-    The ids are processed in batches of max size 200
-    :param project_name:
-    :param organization:
-    :param batch_ids:
-    :return:
-    """
-    if len(batch_ids) > BATCH_MAXIMUM:
-        err_string = (
-            f"Maximum batch size of {BATCH_MAXIMUM} Exceeded.\nReceived Batch size of {len(batch_ids)}. "
-            f"Reduce list size"
-        )
-        logger.error(err_string)
-        raise ValueError(err_string)
-    get_work_items_batch_url = f"https://dev.azure.com/{organization}/{project_name}/_apis/wit/workitemsbatch"
-
-    body = {"ids": batch_ids, "$expand": "All", "errorPolicy": "Omit"}
-    res = requests.request(
-        method="POST",
-        url=get_work_items_batch_url,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        json=body,
-        params=DEFAULT_ADO_PARAMS,
-        headers=APPLICATION_JSON_HEADERS,
-    )
-    res.raise_for_status()
-    return res.json()
-
-
-def get_source_work_items_from_wiql(organization: str, project_name: str, wiql: dict):
-    """
-    Runs a WIQL request against the source defined in the job instance and using all the filters defined for the job
-    :param wiql: Json wiql query
-    :param project_name:
-    :param organization:
-    :return: Response from WIQL Restapi Endpoint.
-    """
-    wiql_url = f"https://dev.azure.com/{organization}/{project_name}/_apis/wit/wiql"
-
-    resp = requests.request(
-        method="POST",
-        url=wiql_url,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        json=wiql,
-        params=DEFAULT_ADO_PARAMS,
-        headers=APPLICATION_JSON_HEADERS,
-    )
-    resp.raise_for_status()
-    if resp.status_code != 200:
-        raise ConnectionError(
-            f"get_source_work_items_from_wiql expected a HTTP 200 but received a HTTP {resp.status_code}")
-    return resp.json()
-
-
-def create_source_work_item(organization: str, project_name: str, work_item_type: str, work_item_create_body):
-    creation_url = f"https://dev.azure.com/{organization}/{project_name}/_apis/wit" \
-                   f"/workitems/${work_item_type}"
-
-    res = requests.request(
-        method="POST",
-        url=creation_url,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        json=work_item_create_body,
-        params=DEFAULT_ADO_PARAMS,
-        headers=APPLICATION_JSON_PATCH_HEADERS,
-    )
-
-    res.raise_for_status()
-    # Add the created work item into the relationship map. Lookup required for hierarchy creation
-    return res.json()
-
-
-def update_work_item(url: str, work_item_update_body):
-    res = requests.request(
-        method="PATCH",
-        url=url,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        json=work_item_update_body,
-        params=DEFAULT_ADO_PARAMS,
-        headers=APPLICATION_JSON_PATCH_HEADERS,
-    )
-
-    res.raise_for_status()
-    # Add the created work item into the relationship map. Lookup required for hierarchy creation
-    return res.json()
-
-
-def get_comments(comment_url: str):
-    """
-    Runs a WIQL request against the source defined in the job instance and using all the filters defined for the job
-    :return: Comments jsons.
-    """
-
-    resp = requests.request(
-        method="GET",
-        url=comment_url,
-        auth=HTTPBasicAuth("", os.environ["PAT_TOKEN"]),
-        params=DEFAULT_ADO_PARAMS,
-        headers=APPLICATION_JSON_HEADERS,
-    )
-    resp.raise_for_status()
-    return resp.json()
+        return work_item_details_json["value"]
+
+    def _get_work_items_batch(self, batch_ids: list, fields: list = None, expand: str = "All"):
+        """
+        Get Work Item Details matching the batch_ids passed
+        :param batch_ids: At most BATCH_MAXIMUM ids
+        :param fields: Field projection - sent instead of $expand
+        :param expand: $expand value when no fields are passed
+        :return:
+        """
+        if len(batch_ids) > BATCH_MAXIMUM:
+            err_string = (
+                f"Maximum batch size of {BATCH_MAXIMUM} Exceeded.\nReceived Batch size of {len(batch_ids)}. "
+                f"Reduce list size"
+            )
+            logger.error(err_string)
+            raise ValueError(err_string)
+
+        body = {"ids": batch_ids, "errorPolicy": "Omit"}
+        if fields:
+            body["fields"] = fields
+        else:
+            body["$expand"] = expand
+        return self.request("POST", f"{self.project_url}/_apis/wit/workitemsbatch", json=body, idempotent=True).json()
+
+    def get_work_items_from_wiql(self, wiql: dict, top: int = None):
+        """
+        Runs a WIQL request against the configured organization/project
+        timePrecision is enabled so ChangedDate watermarks compare on the full timestamp
+        :param wiql: Json wiql query
+        :param top: Optional maximum number of work items returned
+        :return: Response from WIQL Restapi Endpoint.
+        """
+        params = {"timePrecision": "true"}
+        if top is not None:
+            params["$top"] = top
+        resp = self.request("POST", f"{self.project_url}/_apis/wit/wiql", json=wiql, params=params, idempotent=True)
+        if resp.status_code != 200:
+            raise ConnectionError(
+                f"get_work_items_from_wiql expected a HTTP 200 but received a HTTP {resp.status_code}")
+        return resp.json()
+
+    def query_ids(self, wiql: dict):
+        """
+        Runs an AND-ed WIQL query of any size - past the WIQL_MAXIMUM result cap of a single query
+        The first page of WIQL_MAXIMUM ids runs immediately. If it is full the remaining ids up to the highest
+        match are split into [System.Id] windows WIQL_MAXIMUM ids wide, which can never overflow, and the windows
+        are queried concurrently as the returned generator is consumed
+        :param wiql: Json wiql query without an ORDER BY
+        :return: Tuple of (asOf of the first page, generator of id lists in ascending id order)
+        """
+        first_page = self.get_work_items_from_wiql(window_wiql(wiql), top=WIQL_MAXIMUM)
+        ids = [elem["id"] for elem in first_page["workItems"]]
+        return first_page.get("asOf"), self._iter_id_windows(wiql, ids)
+
+    def _iter_id_windows(self, wiql: dict, ids: list):
+        yield ids
+        if len(ids) < WIQL_MAXIMUM:
+            return
+        last = self.get_work_items_from_wiql(window_wiql(wiql, after=ids[-1], descending=True), top=1)["workItems"]
+        if not last:
+            return
+        windows = [(after, min(after + WIQL_MAXIMUM, last[0]["id"]))
+                   for after in range(ids[-1], last[0]["id"], WIQL_MAXIMUM)]
+        logger.debug(f"WIQL matched over {WIQL_MAXIMUM} work items - querying {len(windows)} more id windows")
+
+        def query(window):
+            found = self.get_work_items_from_wiql(window_wiql(wiql, *window), top=WIQL_MAXIMUM)
+            return [elem["id"] for elem in found["workItems"]]
+
+        yield from self.ordered_map(query, windows)
+
+    def get_revisions_page(self, continuation_token: str = None, fields: list = None, start_date: str = None,
+                           latest_only: bool = False) -> dict:
+        """
+        Reads one page of the reporting work item revisions api
+        https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/reporting%20work%20item%20revisions/read%20reporting%20revisions%20get
+        :param continuation_token: Token of the previous page. None starts from start_date or the beginning
+        :param fields: Only return these fields
+        :param start_date: Only return revisions made after this date - ignored when resuming from a token
+        :param latest_only: Only return the latest revision of each work item
+        :return: Page json with values, continuationToken and isLastBatch
+        """
+        params = {"$maxPageSize": REVISIONS_PAGE_SIZE}
+        if continuation_token:
+            params["continuationToken"] = continuation_token
+        elif start_date:
+            params["startDateTime"] = start_date
+        if fields:
+            params["fields"] = ",".join(fields)
+        if latest_only:
+            params["includeLatestOnly"] = "true"
+        return self.request("GET", f"{self.project_url}/_apis/wit/reporting/workitemrevisions", params=params).json()
+
+    def get_work_item_types(self) -> list:
+        """
+        https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/work%20item%20types/list
+        :return: List of the projects work item types
+        """
+        return self.request("GET", f"{self.project_url}/_apis/wit/workitemtypes").json()["value"]
+
+    def get_work_item_type_states(self, work_item_type: str) -> list:
+        """
+        https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/work%20item%20type%20states/list
+        :return: List of the states a work item type allows
+        """
+        url = f"{self.project_url}/_apis/wit/workitemtypes/{work_item_type}/states"
+        return self.request("GET", url).json()["value"]
+
+    def get_classification_nodes(self, depth: int = CLASSIFICATION_DEPTH) -> list:
+        """
+        https://docs.microsoft.com/en-us/rest/api/azure/devops/wit/classification%20nodes/get%20root%20nodes
+        :return: The projects root area and iteration nodes with their children up to depth levels down
+        """
+        return self.request("GET", f"{self.project_url}/_apis/wit/classificationnodes",
+                            params={"$depth": depth}).json()["value"]
+
+    def get_analytics(self, apply: str) -> list:
+        """
+        Runs an Analytics OData aggregation over the projects work items
+        Server side paging is followed through @odata.nextLink
+        :param apply: $apply value from build_analytics_apply
+        :return: List of aggregate rows
+        """
+        url = f"{self.analytics_url}/{self.organization}/{self.project_name}/_odata/{ANALYTICS_VERSION}/WorkItems"
+        resp = self.request("GET", url, params={"$apply": apply}, api_version=False).json()
+        rows = resp.get("value", [])
+        while resp.get("@odata.nextLink"):
+            resp = self.request("GET", resp["@odata.nextLink"], api_version=False).json()
+            rows += resp.get("value", [])
+        return rows
+
+    def create_work_item(self, work_item_type: str, work_item_create_body):
+        creation_url = f"{self.project_url}/_apis/wit/workitems/${work_item_type}"
+        return self.request("POST", creation_url, json=work_item_create_body,
+                            headers=APPLICATION_JSON_PATCH_HEADERS).json()
+
+    def _batch_operation(self, path: str, body) -> dict:
+        return {
+            "method": "PATCH",
+            "uri": f"/{self.project_name}/_apis/wit/{path}?api-version={DEFAULT_ADO_PARAMS['api-version']}",
+            "headers": {"Content-Type": "application/json-patch+json"},
+            "body": body,
+        }
+
+    def create_operation(self, work_item_type: str, work_item_create_body) -> dict:
+        """
+        :return: A work item create request for the $batch endpoint
+        """
+        return self._batch_operation(f"workitems/${work_item_type}", work_item_create_body)
+
+    def update_operation(self, work_item_id, work_item_update_body) -> dict:
+        """
+        :return: A work item update request for the $batch endpoint
+        """
+        return self._batch_operation(f"workitems/{work_item_id}", work_item_update_body)
+
+    def batch(self, operations: list) -> list:
+        """
+        Sends up to BATCH_MAXIMUM work item requests in a single call to the $batch endpoint
+        The batch is not transactional - each operation succeeds or fails on its own
+        :param operations: Requests built by create_operation
+        :return: List of {"code": int, "body": dict} in operation order
+        """
+        if len(operations) > BATCH_MAXIMUM:
+            raise ValueError(f"Maximum batch size of {BATCH_MAXIMUM} Exceeded. Received {len(operations)}")
+        resp = self.request("POST", f"{self.base_url}/{self.organization}/_apis/wit/$batch", json=operations)
+        results = []
+        for value in resp.json()["value"]:
+            body = value.get("body")
+            if isinstance(body, str):
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    body = {"message": body}
+            results.append({"code": value.get("code"), "body": body or {}})
+        return results
+
+    def batch_all(self, operations: list) -> list:
+        """
+        Sends any number of operations as concurrent $batch calls of up to BATCH_MAXIMUM operations
+        A $batch call that fails outright reports code None and the error for each of its operations
+        :return: List of {"code": int, "body": dict} in operation order
+        """
+        chunks = [operations[i: i + BATCH_MAXIMUM] for i in range(0, len(operations), BATCH_MAXIMUM)]
+
+        def send(chunk):
+            try:
+                return self.batch(chunk)
+            except requests.RequestException as ex:
+                logger.error(f"Batch of {len(chunk)} operations failed: {ex}")
+                return [{"code": None, "body": {"message": str(ex)}}] * len(chunk)
+
+        if not chunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            return [result for results in executor.map(send, chunks) for result in results]
+
+    def update_work_item(self, url: str, work_item_update_body):
+        return self.request("PATCH", url, json=work_item_update_body, headers=APPLICATION_JSON_PATCH_HEADERS).json()
+
+    def get_comments(self, comment_url: str):
+        """
+        Fetches every page of comments for a work item from its workItemComments link
+        Pages are followed through the continuationToken until the last one
+        :return: Comments json with the comments of all pages
+        """
+        comment_json = self.request("GET", comment_url, params={"$top": COMMENTS_PAGE_SIZE}, cacheable=True).json()
+        comments = comment_json.get("comments", [])
+        while comment_json.get("continuationToken"):
+            comment_json = self.request("GET", comment_url, cacheable=True, params={
+                "$top": COMMENTS_PAGE_SIZE, "continuationToken": comment_json["continuationToken"]}).json()
+            comments += comment_json.get("comments", [])
+        return {**comment_json, "comments": comments, "count": len(comments), "continuationToken": None}
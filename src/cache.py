@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.projection import Projection, covers, merge, FULL_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = "~/.ado/cache.db"
+DEFAULT_CACHE_TTL = 300
+# Bump when the schema changes - older caches are dropped and rebuilt
+SCHEMA_VERSION = 2
+# Path -> WorkItemCache opened by open_cache
+_OPEN_CACHES = {}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    organization TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    rev INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    fields TEXT,
+    relations INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (organization, id)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    organization TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    rev INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (organization, id)
+);
+CREATE TABLE IF NOT EXISTS syncs (
+    query_key TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    ids TEXT NOT NULL
+);
+"""
+
+
+class WorkItemCache:
+    """
+    Local SQLite store of work item payloads keyed by organization, System.Id and System.Rev
+    Each payload records the field projection it was fetched with so partial payloads are never served
+    to a caller that needs more fields. Also records the watermark of each synced WIQL query so refreshes only download changed items
+    The connection is shared by every thread using the cache so each statement runs under the lock
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS work_items; DROP TABLE IF EXISTS comments; "
+                                    "DROP TABLE IF EXISTS syncs;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_sync(self, query_key: str):
+        """
+        :return: Tuple of (watermark, synced_at, ids) for a previously synced query or None
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT watermark, synced_at, ids FROM syncs WHERE query_key = ?",
+                                    (query_key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def set_sync(self, query_key: str, watermark: str, ids: list):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO syncs (query_key, watermark, synced_at, ids) VALUES (?, ?, ?, ?)",
+                              (query_key, watermark, time.time(), json.dumps(ids)))
+
+    def _rows(self, organization: str, ids: list, oldest: float = 0):
+        # Stay under SQLITE_MAX_VARIABLE_NUMBER on older sqlite builds
+        for i in range(0, len(ids), 900):
+            chunk = ids[i: i + 900]
+            yield from self.conn.execute(
+                f"SELECT id, rev, fields, relations, body FROM work_items WHERE organization = ? AND fetched_at >= ? "
+                f"AND id IN ({','.join('?' * len(chunk))})", (organization, oldest, *chunk))
+
+    def get_work_items(self, organization: str, ids: list, max_age: float = None,
+                       projection: Projection = FULL_PROJECTION) -> dict:
+        """
+        :param max_age: Ignore entries fetched more than max_age seconds ago
+        :param projection: Ignore entries fetched without every field and relation this projection needs
+        :return: Dict of id -> work item for the ids found in the cache
+        """
+        found = {}
+        oldest = time.time() - max_age if max_age is not None else 0
+        with self.lock:
+            rows = list(self._rows(organization, ids, oldest))
+        for work_item_id, _, fields, relations, body in rows:
+            if covers(_projection(fields, relations), projection):
+                found[work_item_id] = json.loads(body)
+        return found
+
+    def get_revs(self, organization: str, ids: list, projection: Projection = FULL_PROJECTION) -> dict:
+        """
+        Checks which work items are cached without decoding their payloads
+        :param projection: Ignore entries fetched without every field and relation this projection needs
+        :return: Dict of id -> rev for the ids found in the cache
+        """
+        revs = {}
+        with self.lock:
+            for i in range(0, len(ids), 900):
+                chunk = ids[i: i + 900]
+                for work_item_id, rev, fields, relations in self.conn.execute(
+                        f"SELECT id, rev, fields, relations FROM work_items WHERE organization = ? "
+                        f"AND id IN ({','.join('?' * len(chunk))})", (organization, *chunk)):
+                    if covers(_projection(fields, relations), projection):
+                        revs[work_item_id] = rev
+        return revs
+
+    def put_work_items(self, organization: str, work_items: list, projection: Projection = FULL_PROJECTION):
+        """
+        Stores work items fetched with the projection passed
+        A partial payload at the same revision as the stored one is merged into it rather than replacing it
+        """
+        work_items = [item for item in work_items if item is not None]
+        with self.lock:
+            existing = {row[0]: row for row in self._rows(organization, [item["id"] for item in work_items])}
+        now = time.time()
+        rows = []
+        for item in work_items:
+            rev = item.get("rev", item["fields"].get("System.Rev", 0))
+            item_projection = projection
+            old = existing.get(item["id"])
+            if old is not None and old[1] == rev and projection.fields is not None:
+                old_item = json.loads(old[4])
+                item = {**old_item, **item, "fields": {**old_item["fields"], **item["fields"]}}
+                item_projection = merge(_projection(old[2], old[3]), projection)
+            fields = None if item_projection.fields is None else ",".join(item_projection.fields)
+            rows.append((organization, item["id"], rev, now, fields, int(item_projection.relations), json.dumps(item)))
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO work_items (organization, id, rev, fetched_at, fields, relations, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def record_writes(self, organization: str, work_items: list, unknown_ids=()):
+        """
+        Keeps the cache in step with work items the cli created or updated
+        The payloads returned by the writes are stored and ids whose write has an unknown outcome are dropped.
+        Every synced query of the organization is expired as a new State or a new item changes what it matches.
+        Their watermarks are kept so the next list still downloads only the changed items
+        :param work_items: Work items returned by a create or update - every field without relations
+        :param unknown_ids: Ids of work items whose update may or may not have been applied
+        """
+        work_items = [item for item in work_items if item]
+        if work_items:
+            self.put_work_items(organization, work_items, projection=Projection(fields=None, relations=False))
+        unknown_ids = list(unknown_ids)
+        with self.lock, self.conn:
+            for i in range(0, len(unknown_ids), 900):
+                chunk = unknown_ids[i: i + 900]
+                self.conn.execute(f"DELETE FROM work_items WHERE organization = ? "
+                                  f"AND id IN ({','.join('?' * len(chunk))})", (organization, *chunk))
+            self.conn.execute("UPDATE syncs SET synced_at = 0 WHERE substr(query_key, 1, ?) = ?",
+                              (len(organization) + 1, f"{organization}/"))
+
+    def recent_ids(self, organization: str, limit: int) -> list:
+        """
+        :return: Ids of the most recently fetched work items of an organization
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT id FROM work_items WHERE organization = ? "
+                                     "ORDER BY fetched_at DESC LIMIT ?", (organization, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_comments(self, organization: str, work_item_id: int, rev: int):
+        """
+        :return: Cached comments json for the work item if it was stored at the same System.Rev
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM comments WHERE organization = ? AND id = ? AND rev = ?",
+                                    (organization, work_item_id, rev)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_comments(self, organization: str, work_item_id: int, rev: int, comments: dict):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO comments (organization, id, rev, body) VALUES (?, ?, ?, ?)",
+                              (organization, work_item_id, rev, json.dumps(comments)))
+
+
+def _projection(fields: str, relations: int) -> Projection:
+    return Projection(fields=None if fields is None else fields.split(","), relations=bool(relations))
+
+
+def open_cache(run_args):
+    """
+    Caches stay open for the life of the process so `ado daemon` keeps a warm connection between commands
+    :return: WorkItemCache at the configured cacheFile or None if caching is disabled with `cache: false`
+    """
+    if not run_args.get("cache", True):
+        return None
+    path = os.path.expanduser(run_args.get("cacheFile") or DEFAULT_CACHE_FILE)
+    try:
+        if path not in _OPEN_CACHES:
+            _OPEN_CACHES[path] = WorkItemCache(path)
+        return _OPEN_CACHES[path]
+    except sqlite3.Error as ex:
+        logger.warning(f"Work item cache unavailable: {ex}")
+        return None
@@ -0,0 +1,296 @@
+"""
+`ado daemon` - a warm background process that runs `ado` subcommands for short lived clients
+
+The daemon keeps the imported modules, the parsed config, the pooled keep-alive sessions and the open work item
+cache between commands. Clients send their argv over a Unix socket and receive stdout, stderr and the exit code
+back as framed messages. Commands run one at a time in the daemon as they redirect sys.stdout/sys.stderr
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import time
+from contextlib import redirect_stderr, redirect_stdout
+
+from src.ado import ADO_CONFIG_FILE, ADO_DAEMON_SOCKET
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+DEFAULT_IDLE_TIMEOUT = 3600
+START_TIMEOUT = 5
+FRAME_HEADER = struct.Struct(">cI")
+STDOUT, STDERR, EXIT, REFUSED = b"1", b"2", b"x", b"r"
+
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def token_digest():
+    token = os.environ.get("PAT_TOKEN")
+    return hashlib.sha256(token.encode()).hexdigest() if token is not None else None
+
+
+def send_frame(wfile, channel: bytes, payload: bytes):
+    wfile.write(FRAME_HEADER.pack(channel, len(payload)) + payload)
+    wfile.flush()
+
+
+def read_frame(rfile):
+    """
+    :return: Tuple of (channel, payload) or None when the connection closed
+    """
+    header = rfile.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    channel, length = FRAME_HEADER.unpack(header)
+    return channel, rfile.read(length)
+
+
+def forward(argv: list):
+    """
+    Runs an ado command in the daemon when one is listening
+    :return: The commands exit code or None when the daemon is unavailable and the command should run in-process
+    """
+    if not supported():
+        return None
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(ADO_DAEMON_SOCKET)
+    except OSError:
+        return None
+
+    terminal = list(shutil.get_terminal_size()) if sys.stdout.isatty() else None
+    request = {"version": PROTOCOL_VERSION, "argv": argv, "cwd": os.getcwd(),
+               "config": os.path.abspath(ADO_CONFIG_FILE), "token": token_digest(), "terminal": terminal}
+    with conn, conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+        wfile.write(json.dumps(request).encode() + b"\n")
+        wfile.flush()
+        streams = {STDOUT: sys.stdout.buffer, STDERR: sys.stderr.buffer}
+        while True:
+            frame = read_frame(rfile)
+            if frame is None:
+                sys.stderr.write("ado daemon closed the connection before the command finished\n")
+                return 1
+            channel, payload = frame
+            if channel == REFUSED:
+                logging.getLogger("src.ado").debug(f"Running in-process - {payload.decode()}")
+                return None
+            if channel == EXIT:
+                return int(payload)
+            try:
+                streams[channel].write(payload)
+                streams[channel].flush()
+            except BrokenPipeError:
+                # Reader went away e.g. `ado list --format csv | head` - the daemon sees the closed socket
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                return 1
+
+
+def send_command(command: str):
+    """
+    :return: The daemons json reply to a control command or None when no daemon is listening
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(ADO_DAEMON_SOCKET)
+            with conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+                wfile.write(json.dumps({"version": PROTOCOL_VERSION, "command": command}).encode() + b"\n")
+                wfile.flush()
+                frame = read_frame(rfile)
+        return json.loads(frame[1]) if frame else None
+    except OSError:
+        return None
+
+
+class FrameWriter(io.TextIOBase):
+    """
+    Text stream sending everything written to it as frames on one channel of the client connection
+    terminal_size is the clients terminal or None when the clients output is not a terminal
+    """
+
+    def __init__(self, wfile, channel: bytes, terminal_size=None):
+        self.wfile = wfile
+        self.channel = channel
+        self.terminal_size = terminal_size
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        if s:
+            send_frame(self.wfile, self.channel, s.encode())
+        return len(s)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        server.last_request = time.time()
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        if request.get("version") != PROTOCOL_VERSION:
+            return send_frame(self.wfile, REFUSED, b"ado daemon protocol version mismatch")
+        if "command" in request:
+            return self.control(request["command"])
+        if request["config"] != os.path.abspath(ADO_CONFIG_FILE):
+            return send_frame(self.wfile, REFUSED, f"ado daemon serves {ADO_CONFIG_FILE}".encode())
+        if request["token"] != token_digest():
+            return send_frame(self.wfile, REFUSED, b"ado daemon was started with a different PAT_TOKEN")
+
+        server.commands += 1
+        try:
+            terminal = os.terminal_size(request["terminal"]) if request.get("terminal") else None
+            code = self.run(request["argv"], request["cwd"], terminal)
+            send_frame(self.wfile, EXIT, str(code).encode())
+        except BrokenPipeError:
+            logger.debug("Client went away before the command finished")
+
+    def control(self, command: str):
+        if command == "stop":
+            self.server.stopping = True
+        status = {"pid": os.getpid(), "uptime": round(time.time() - self.server.started), "socket": ADO_DAEMON_SOCKET,
+                  "config": ADO_CONFIG_FILE, "commands": self.server.commands}
+        send_frame(self.wfile, STDOUT, json.dumps(status).encode())
+
+    def run(self, argv: list, cwd: str, terminal=None) -> int:
+        """
+        Runs src.ado.ado with the clients argv, working directory and output streams
+        :return: Exit code
+        """
+        from src.ado import ado
+
+        out, err = FrameWriter(self.wfile, STDOUT, terminal), FrameWriter(self.wfile, STDERR)
+        previous_argv, previous_cwd = sys.argv, os.getcwd()
+        previous_handlers, previous_level = logging.root.handlers[:], logging.root.level
+        # logging.basicConfig in ado() binds a fresh handler to this commands stderr
+        logging.root.handlers = []
+        try:
+            sys.argv = ["ado", *argv]
+            os.chdir(cwd)
+            with redirect_stdout(out), redirect_stderr(err):
+                ado(use_daemon=False)
+            return 0
+        except SystemExit as ex:
+            if ex.code is None or isinstance(ex.code, int):
+                return ex.code or 0
+            err.write(f"{ex.code}\n")
+            return 1
+        except BrokenPipeError:
+            raise
+        except Exception:
+            logger.exception(f"ado {' '.join(argv)} failed in the daemon")
+            return 1
+        finally:
+            sys.argv = previous_argv
+            os.chdir(previous_cwd)
+            logging.root.handlers = previous_handlers
+            logging.root.setLevel(previous_level)
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+
+    def __init__(self, path: str, idle_timeout: float):
+        # Only the owner may connect - the socket runs commands with the owners PAT_TOKEN
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(path, DaemonHandler)
+        finally:
+            os.umask(previous_umask)
+        self.timeout = idle_timeout
+        self.started = time.time()
+        self.last_request = self.started
+        self.commands = 0
+        self.stopping = False
+
+    def serve_until_idle(self):
+        while not self.stopping and time.time() - self.last_request < self.timeout:
+            self.handle_request()
+
+
+def serve(idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """
+    Serves commands on ADO_DAEMON_SOCKET until stopped or idle for idle_timeout seconds
+    """
+    if send_command("status") is not None:
+        logger.error(f"ado daemon is already running on {ADO_DAEMON_SOCKET}")
+        return 1
+    if os.path.exists(ADO_DAEMON_SOCKET):
+        # Left behind by a daemon that did not shut down cleanly
+        os.unlink(ADO_DAEMON_SOCKET)
+    os.makedirs(os.path.dirname(ADO_DAEMON_SOCKET), exist_ok=True)
+
+    # Warm the imports every subcommand needs
+    import src.actions  # noqa: F401
+    import requests  # noqa: F401
+    import tabulate  # noqa: F401
+
+    server = DaemonServer(ADO_DAEMON_SOCKET, idle_timeout)
+    logger.info(f"ado daemon {os.getpid()} listening on {ADO_DAEMON_SOCKET}")
+    try:
+        server.serve_until_idle()
+    finally:
+        server.server_close()
+        if os.path.exists(ADO_DAEMON_SOCKET):
+            os.unlink(ADO_DAEMON_SOCKET)
+    return 0
+
+
+def daemon_command(run_args):
+    logger.debug(run_args)
+    if not supported():
+        logger.error("ado daemon needs Unix socket support")
+        return 1
+
+    action = run_args.get("action") or "status"
+    idle_timeout = float(run_args.get("daemonIdleTimeout", DEFAULT_IDLE_TIMEOUT))
+    status = send_command("status")
+    if action == "run":
+        return serve(idle_timeout)
+    if action == "status":
+        if status is None:
+            print("ado daemon is not running")
+            return 1
+        print(f"ado daemon {status['pid']} on {status['socket']} - up {status['uptime']}s, "
+              f"{status['commands']} commands served")
+        return 0
+    if action == "stop":
+        if status is None:
+            print("ado daemon is not running")
+            return 0
+        send_command("stop")
+        print(f"ado daemon {status['pid']} stopped")
+        return 0
+
+    if status is not None:
+        print(f"ado daemon {status['pid']} is already running on {status['socket']}")
+        return 0
+    subprocess.Popen([sys.executable, "-m", "src.daemon", str(idle_timeout)], stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+                     cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        status = send_command("status")
+        if status is not None:
+            print(f"ado daemon {status['pid']} started on {status['socket']}")
+            return 0
+        time.sleep(0.05)
+    logger.error(f"ado daemon did not start within {START_TIMEOUT}s")
+    return 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    sys.exit(serve(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_IDLE_TIMEOUT))
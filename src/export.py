@@ -0,0 +1,123 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Columns of a csv export when no --fields are passed
+DEFAULT_EXPORT_FIELDS = [
+    "System.Id", "System.Rev", "System.WorkItemType", "System.Title", "System.State", "System.AssignedTo",
+    "System.AreaPath", "System.IterationPath", "System.ChangedBy", "System.ChangedDate",
+]
+
+
+class ExportCheckpoint:
+    """
+    Checkpoint of an export stored next to the output file
+    Records the continuation token of the next page and the output size once the previous page was written
+    A resumed export truncates the output back to that size - dropping a partly written page - and carries on
+    from the token. A finished export keeps its last token so a rerun appends only revisions made since
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.state)
+
+    def save(self, **state):
+        self.state.update(state)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def export_value(value):
+    """
+    :return: Csv cell of a field value - identities give their unique name
+    """
+    if isinstance(value, dict):
+        return value.get("uniqueName") or value.get("displayName", "")
+    if isinstance(value, (list, bool)):
+        return json.dumps(value)
+    return value
+
+
+def field_value(revision: dict, field: str):
+    if field not in revision["fields"] and field in ("System.Id", "System.Rev"):
+        return revision["id" if field == "System.Id" else "rev"]
+    return export_value(revision["fields"].get(field, ""))
+
+
+def encode_page(revisions: list, output_format: str, fields: list) -> bytes:
+    if output_format == "ndjson":
+        return "".join(json.dumps(revision) + "\n" for revision in revisions).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([field_value(revision, field) for field in fields] for revision in revisions)
+    return buffer.getvalue().encode()
+
+
+def export_revisions(client, output: str, output_format: str = "ndjson", fields: list = None, compress: bool = None,
+                     checkpoint_path: str = None, start_date: str = None, latest_only: bool = False) -> int:
+    """
+    Streams the reporting work item revisions to output one page at a time
+    Each page is appended (as its own gzip member when compressing) and checkpointed before the next is requested,
+    so memory stays constant however many revisions there are and an interrupted export resumes where it stopped
+    :param output: File to write
+    :param fields: Fields requested - defaults to every field for ndjson and DEFAULT_EXPORT_FIELDS for csv
+    :param compress: Gzip the output. Defaults to True when output ends in .gz
+    :param checkpoint_path: Defaults to <output>.checkpoint.json
+    :return: Number of revisions written by this run
+    """
+    compress = output.endswith(".gz") if compress is None else compress
+    if output_format == "csv":
+        fields = fields or DEFAULT_EXPORT_FIELDS
+    checkpoint = ExportCheckpoint(checkpoint_path or f"{output}.checkpoint.json")
+    settings = {"format": output_format, "fields": fields, "compress": compress, "latestOnly": latest_only}
+
+    token = None
+    if checkpoint.exists and os.path.isfile(output):
+        previous = {key: checkpoint.state.get(key) for key in settings}
+        if previous != settings:
+            raise ValueError(f"Checkpoint {checkpoint.path} was written with {previous} - remove it to start over")
+        token = checkpoint.state["token"]
+        # Drop anything written after the last checkpoint
+        with open(output, "r+b") as f:
+            f.truncate(checkpoint.state["bytes"])
+        logger.info(f"Resuming export after {checkpoint.state['revisions']} revisions")
+    else:
+        checkpoint.state = {}
+        with open(output, "wb") as f:
+            if output_format == "csv":
+                header = (",".join(fields) + "\n").encode()
+                f.write(gzip.compress(header) if compress else header)
+        checkpoint.save(**settings, token=None, bytes=os.path.getsize(output), revisions=0, complete=False)
+
+    written = 0
+    with open(output, "ab") as f:
+        while True:
+            page = client.get_revisions_page(continuation_token=token, fields=fields, start_date=start_date,
+                                             latest_only=latest_only)
+            revisions = page.get("values", [])
+            if revisions:
+                data = encode_page(revisions, output_format, fields)
+                f.write(gzip.compress(data) if compress else data)
+                f.flush()
+                os.fsync(f.fileno())
+                written += len(revisions)
+            token = page.get("continuationToken") or token
+            checkpoint.save(token=token, bytes=f.tell(), revisions=checkpoint.state["revisions"] + len(revisions),
+                            complete=bool(page.get("isLastBatch", True)))
+            logger.debug(f"Exported {checkpoint.state['revisions']} revisions")
+            if page.get("isLastBatch", True):
+                return written
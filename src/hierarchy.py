@@ -0,0 +1,86 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+HIERARCHY_FORWARD = "System.LinkTypes.Hierarchy-Forward"
+HIERARCHY_REVERSE = "System.LinkTypes.Hierarchy-Reverse"
+# Upper bound on batched fetch rounds when completing the tree - one round per missing level
+MAX_FETCH_ROUNDS = 32
+
+
+def link_id(url: str) -> int:
+    return int(url.rstrip("/").rsplit("/", 1)[-1])
+
+
+class HierarchyIndex:
+    """
+    Parent/child index over work items built in a single pass over their hierarchy relations
+    """
+
+    def __init__(self, work_items: list = None):
+        self.items = {}
+        self.order = []
+        self.parent = {}
+        # parent id -> dict used as an insertion ordered set of child ids
+        self.children = {}
+        self.add(work_items or [])
+
+    def add(self, work_items: list):
+        for item in work_items:
+            if item is None or item["id"] in self.items:
+                continue
+            self.items[item["id"]] = item
+            self.order.append(item["id"])
+            for link in item.get("relations") or []:
+                if link["rel"] == HIERARCHY_FORWARD:
+                    self._link(item["id"], link_id(link["url"]))
+                elif link["rel"] == HIERARCHY_REVERSE:
+                    self._link(link_id(link["url"]), item["id"])
+
+    def _link(self, parent: int, child: int):
+        self.parent[child] = parent
+        self.children.setdefault(parent, {})[child] = None
+
+    def complete(self, fetch, exclude_states: list = ()):
+        """
+        Fetches the ancestors and descendants referenced by the indexed items but missing from it
+        Each level of missing items is requested with a single call to fetch
+        :param fetch: Callable taking a list of ids and returning work items with relations
+        :param exclude_states: Descendants in these states are not added
+        """
+        up = set(self.items)
+        down = set(self.items)
+        for _ in range(MAX_FETCH_ROUNDS):
+            missing_up = {self.parent[i] for i in up if i in self.parent and self.parent[i] not in self.items}
+            missing_down = {c for i in down for c in self.children.get(i, ()) if c not in self.items}
+            if not missing_up and not missing_down:
+                return
+            logger.debug(f"Fetching {len(missing_up)} missing parents and {len(missing_down)} missing children")
+            fetched = [item for item in fetch(sorted(missing_up | missing_down)) if item is not None]
+            fetched = [item for item in fetched if item["id"] in missing_up
+                       or item["fields"].get("System.State") not in exclude_states]
+            self.add(fetched)
+            fetched_ids = {item["id"] for item in fetched}
+            up = missing_up & fetched_ids
+            down = missing_down & fetched_ids
+
+    def walk(self):
+        """
+        Iterative depth first walk from every root in index order
+        :return: Generator of (work_item, depth)
+        """
+        visited = set()
+        for only_roots in (True, False):
+            # The second pass picks up items only reachable through a parent cycle
+            for root in self.order:
+                if root in visited or (only_roots and self.parent.get(root) in self.items):
+                    continue
+                stack = [(root, 0)]
+                while stack:
+                    work_item_id, depth = stack.pop()
+                    if work_item_id in visited:
+                        continue
+                    visited.add(work_item_id)
+                    yield self.items[work_item_id], depth
+                    children = [c for c in self.children.get(work_item_id, ()) if c in self.items and c not in visited]
+                    stack.extend((c, depth + 1) for c in reversed(children))
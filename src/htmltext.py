@@ -0,0 +1,65 @@
+from html.parser import HTMLParser
+
+# Elements whose content is code rather than text
+SKIPPED_ELEMENTS = {"script", "style"}
+
+
+class TextCollector(HTMLParser):
+    """
+    Collects the text between tags - matching BeautifulSoup.get_text(separator)
+    A `<` that does not start a tag stays text and script/style content is skipped
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        # Data between two tags can arrive in several calls e.g. around a bare `<`
+        self.text = []
+        self.skipping = 0
+
+    def flush(self):
+        if self.text:
+            self.parts.append("".join(self.text))
+            self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in SKIPPED_ELEMENTS:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in SKIPPED_ELEMENTS and self.skipping:
+            self.skipping -= 1
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def handle_data(self, data):
+        if data and not self.skipping:
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        self.flush()
+
+
+def html_to_text(value: str, separator: str = "\n") -> str:
+    """
+    Converts a work item html field or comment into plain text without building a document tree
+    :param value: Html string - e.g. System.Description
+    :param separator: Joins the text found between tags
+    :return: Text with entities unescaped
+    """
+    if not value:
+        return ""
+    collector = TextCollector()
+    collector.feed(value)
+    collector.close()
+    return separator.join(collector.parts)
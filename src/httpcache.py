@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CACHE_DIR = "~/.ado/http-cache"
+DEFAULT_HTTP_CACHE_SIZE_MB = 100
+# Response headers kept with a cached body
+STORED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+
+class HttpCache:
+    """
+    On-disk cache of GET responses that carry an ETag or Last-Modified validator
+    Each entry is one file - a json metadata line followed by the raw body. Entries are revalidated with
+    If-None-Match/If-Modified-Since and a 304 is answered from disk. The least recently used entries are evicted
+    once the directory grows past max_bytes. Recency and size are tracked in memory - the directory is scanned once
+    """
+
+    def __init__(self, directory: str = DEFAULT_HTTP_CACHE_DIR, max_bytes: int = DEFAULT_HTTP_CACHE_SIZE_MB << 20):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Entry path -> size in bytes, least recently used first. Loaded from disk on the first store
+        self._index = None
+        self._size = 0
+
+    def _path(self, url: str, params: dict) -> str:
+        key = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or {}).items())])
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def lookup(self, url: str, params: dict):
+        """
+        :return: Tuple of (metadata dict, body bytes) for a stored response or None
+        """
+        try:
+            with open(self._path(url, params), "rb") as f:
+                meta = json.loads(f.readline())
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def validators(meta: dict) -> dict:
+        """
+        :return: Conditional request headers revalidating a stored response
+        """
+        headers = {}
+        if meta["headers"].get("ETag"):
+            headers["If-None-Match"] = meta["headers"]["ETag"]
+        if meta["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+        return headers
+
+    def hit(self, url: str, params: dict):
+        """
+        Records a 304 answered from disk and marks the entry as recently used
+        """
+        path = self._path(url, params)
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and path in self._index:
+                self._index.move_to_end(path)
+        try:
+            # Recency for the next process loading the index
+            os.utime(path)
+        except OSError:
+            pass
+        logger.debug(f"HTTP cache hit ({self.hits} hits, {self.misses} misses) {url}")
+
+    def store(self, url: str, params: dict, headers, body: bytes):
+        """
+        Stores a 200 response if it has a validator - then evicts least recently used entries over max_bytes
+        """
+        with self._lock:
+            self.misses += 1
+        logger.debug(f"HTTP cache miss ({self.hits} hits, {self.misses} misses) {url}")
+        if not headers.get("ETag") and not headers.get("Last-Modified"):
+            return
+        meta = {"url": url, "headers": {key: headers[key] for key in STORED_HEADERS if headers.get(key)}}
+        data = json.dumps(meta).encode() + b"\n" + body
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(url, params)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, path)
+        except OSError as ex:
+            logger.debug(f"HTTP cache store failed: {ex}")
+            return
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            self._size += len(data) - self._index.pop(path, 0)
+            self._index[path] = len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _load_index(self):
+        """
+        Indexes the entries on disk least recently used (by file mtime) first
+        """
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                # Skip in flight temporary files
+                if entry.is_file() and "." not in entry.name:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError:
+            pass
+        self._index = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._size = sum(self._index.values())
+
+    def _evict(self):
+        """
+        Deletes least recently used entries until the cache is back to 90% of max_bytes
+        """
+        target = self.max_bytes * 0.9
+        evicted = 0
+        while self._index and self._size > target:
+            path, size = self._index.popitem(last=False)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still on disk - keep counting it as the most recently used
+                self._index[path] = size
+                break
+            self._size -= size
+            evicted += 1
+        logger.debug(f"HTTP cache evicted {evicted} entries - {self._size} bytes remain")
+
+
+def open_http_cache(run_args):
+    """
+    :return: HttpCache at the configured httpCacheDir or None if disabled with `httpCache: false`
+    """
+    if not run_args.get("httpCache", True):
+        return None
+    return HttpCache(run_args.get("httpCacheDir") or DEFAULT_HTTP_CACHE_DIR,
+                     int(float(run_args.get("httpCacheSize", DEFAULT_HTTP_CACHE_SIZE_MB)) * (1 << 20)))
@@ -0,0 +1,266 @@
+"""
+Project metadata - work item types, their states and the area/iteration trees - kept on disk per project
+
+Arguments are validated against it before any request is sent and `ado completion` reads it without network calls.
+It is refreshed once older than metadataTtl, and once early when a value is not found in case it was just created
+"""
+import json
+import logging
+import os
+import sys
+import time
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METADATA_DIR = "~/.ado/metadata"
+DEFAULT_METADATA_TTL = 86400
+# Metadata older than this is refreshed once when a value is not in it
+REFRESH_ON_MISS_AGE = 60
+# Suggestions shown when a value is not valid
+MAX_SUGGESTIONS = 3
+# Work item ids offered by `ado completion`
+COMPLETION_ID_LIMIT = 200
+COMPLETION_KINDS = ["commands", "ids", "types", "states", "areas", "iterations"]
+
+BASH_COMPLETION = r"""# ado bash completion. Enable with: eval "$(ado completion bash)"
+_ado_completion() {
+    local cur="${COMP_WORDS[COMP_CWORD]}" prev="${COMP_WORDS[COMP_CWORD-1]}" kind word
+    COMPREPLY=()
+    if [ "$COMP_CWORD" -eq 1 ]; then
+        COMPREPLY=($(compgen -W "%(commands)s" -- "$cur"))
+        return
+    fi
+    case "$prev" in
+        -wit|--type) kind=types ;;
+        --state|--from-state) kind=states ;;
+        -ap|--area-path) kind=areas ;;
+        -it|--iteration) kind=iterations ;;
+        -p|--parent) kind=ids ;;
+        -*) return ;;
+        *)
+            case "${COMP_WORDS[1]}" in
+                read|open|close) kind=ids ;;
+                move) if [[ "$prev" =~ ^[0-9]+$ ]]; then kind=ids,states; else kind=ids; fi ;;
+                *) return ;;
+            esac ;;
+    esac
+    while IFS= read -r word; do
+        COMPREPLY+=("$(printf '%%q' "$word")")
+    done < <(ado completion --list "$kind" --prefix "$cur" 2>/dev/null)
+}
+complete -F _ado_completion ado
+"""
+
+ZSH_COMPLETION = r"""#compdef ado
+# ado zsh completion. Enable with: eval "$(ado completion zsh)"
+_ado() {
+    local kind prev=${words[CURRENT-1]}
+    local -a values
+    if (( CURRENT == 2 )); then
+        values=(%(commands)s)
+        compadd -a values
+        return
+    fi
+    case $prev in
+        -wit|--type) kind=types ;;
+        --state|--from-state) kind=states ;;
+        -ap|--area-path) kind=areas ;;
+        -it|--iteration) kind=iterations ;;
+        -p|--parent) kind=ids ;;
+        -*) return ;;
+        *)
+            case ${words[2]} in
+                read|open|close) kind=ids ;;
+                move) if [[ $prev == <-> ]]; then kind=ids,states; else kind=ids; fi ;;
+                *) return ;;
+            esac ;;
+    esac
+    values=("${(@f)$(ado completion --list $kind 2>/dev/null)}")
+    compadd -a values
+}
+compdef _ado ado
+"""
+
+
+def metadata_path(run_args, organization: str, project: str) -> str:
+    directory = os.path.expanduser(run_args.get("metadataDir") or DEFAULT_METADATA_DIR)
+    return os.path.join(directory, f"{quote(organization, safe='')}--{quote(project, safe='')}.json")
+
+
+def classification_paths(node: dict, path: str, paths: list):
+    """
+    Collects the area or iteration paths of a classification node and its children e.g. Project\\Team\\Sprint 1
+    """
+    paths.append(path)
+    for child in node.get("children") or []:
+        classification_paths(child, f"{path}\\{child['name']}", paths)
+
+
+def fetch_metadata(client) -> dict:
+    """
+    Downloads the projects work item types, the states each allows and the area and iteration paths
+    """
+    names = [item["name"] for item in client.get_work_item_types() if not item.get("isDisabled")]
+    states = client.ordered_map(lambda name: [state["name"] for state in client.get_work_item_type_states(name)],
+                                names)
+    metadata = {"fetched_at": time.time(), "types": dict(zip(names, states)), "areas": [], "iterations": []}
+    for root in client.get_classification_nodes():
+        kind = "iterations" if root.get("structureType") == "iteration" else "areas"
+        classification_paths(root, root["name"], metadata[kind])
+    return metadata
+
+
+def load_metadata(run_args, client=None, max_age: float = None):
+    """
+    :param client: AdoClient used to refresh stale metadata. Without one the stored metadata is returned as is
+    :param max_age: Refresh metadata older than this many seconds. Defaults to metadataTtl
+    :return: Metadata dict of the configured project or None when there is none stored and it cannot be fetched
+    """
+    organization, project = (client.organization, client.project_name) if client else \
+        (run_args.get("organization"), run_args.get("project"))
+    if not organization or not project:
+        return None
+    path = metadata_path(run_args, organization, project)
+    stored = None
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        pass
+    max_age = float(run_args.get("metadataTtl", DEFAULT_METADATA_TTL)) if max_age is None else max_age
+    if client is None or (stored is not None and time.time() - stored["fetched_at"] < max_age):
+        return stored
+
+    import requests
+    try:
+        metadata = fetch_metadata(client)
+    except (requests.RequestException, ConnectionError, KeyError, ValueError) as ex:
+        logger.debug(f"Could not refresh project metadata for {organization}/{project}: {ex}")
+        return stored
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path)
+    except OSError as ex:
+        logger.debug(f"Could not store project metadata at {path}: {ex}")
+    return metadata
+
+
+def invalid_value(label: str, values, valid: list):
+    """
+    :return: Error message for the first of values not in valid (compared case insensitively) or None
+    """
+    known = {value.lower() for value in valid}
+    for value in values:
+        if value is None or value.lower() in known:
+            continue
+        import difflib
+        by_lower = {option.lower(): option for option in valid}
+        suggestions = [by_lower[match] for match in
+                       difflib.get_close_matches(value.lower(), list(by_lower), n=MAX_SUGGESTIONS, cutoff=0.5)]
+        hint = f"Did you mean {' or '.join(suggestions)}?" if suggestions else \
+            f"Valid values: {', '.join(valid[:20])}{' ...' if len(valid) > 20 else ''}"
+        return f"Unknown {label} '{value}'. {hint}"
+    return None
+
+
+def find_invalid(metadata: dict, work_item_types=(), states=(), area_paths=(), iterations=()):
+    """
+    States are checked against the states of the work_item_types passed, or of every type when none are
+    """
+    by_lower = {name.lower(): name for name in metadata["types"]}
+    types = [by_lower[value.lower()] for value in work_item_types if value.lower() in by_lower] or \
+        list(metadata["types"])
+    valid_states = sorted({state for name in types for state in metadata["types"][name]})
+    return (invalid_value("Work Item Type", work_item_types, list(metadata["types"]))
+            or invalid_value(f"{types[0]} State" if len(types) == 1 else "State", states, valid_states)
+            or invalid_value("Area Path", area_paths, metadata["areas"])
+            or invalid_value("Iteration", iterations, metadata["iterations"]))
+
+
+def validate(run_args, client, work_item_types=(), states=(), area_paths=(), iterations=()):
+    """
+    Checks arguments against the project metadata before any request is sent
+    States are checked against the states of the work_item_types passed when there are any
+    Skipped with `validate: false` in the config or when the metadata cannot be loaded
+    :return: Error message for the first invalid argument or None
+    """
+    checks = {"work_item_types": [value for value in work_item_types if value],
+              "states": [value for value in states if value],
+              "area_paths": [value for value in area_paths if value],
+              "iterations": [value for value in iterations if value]}
+    if not run_args.get("validate", True) or not any(checks.values()):
+        return None
+    metadata = load_metadata(run_args, client)
+    if metadata is None:
+        return None
+    error = find_invalid(metadata, **checks)
+    if error and time.time() - metadata["fetched_at"] > REFRESH_ON_MISS_AGE:
+        # Maybe created since the metadata was stored
+        metadata = load_metadata(run_args, client, max_age=0)
+        error = find_invalid(metadata, **checks)
+    return error
+
+
+def completion_words(run_args, kind: str) -> list:
+    """
+    :param kind: One of COMPLETION_KINDS
+    :return: Words to complete from local data only - never a network call
+    """
+    if kind == "commands":
+        return list(run_args.get("commands") or [])
+    if kind == "ids":
+        from src.cache import open_cache
+        cache = open_cache(run_args)
+        if cache is None or not run_args.get("organization"):
+            return []
+        return [str(work_item_id) for work_item_id in cache.recent_ids(run_args["organization"], COMPLETION_ID_LIMIT)]
+    metadata = load_metadata(run_args)
+    if metadata is None:
+        return []
+    if kind == "types":
+        return list(metadata["types"])
+    if kind == "states":
+        return sorted({state for allowed in metadata["types"].values() for state in allowed})
+    return metadata[kind]
+
+
+def completion_command(run_args):
+    """
+    Prints the bash or zsh completion script, or with --list the words the script completes
+    """
+    if run_args.get("refresh"):
+        if os.environ.get("PAT_TOKEN") is None:
+            logger.info("PAT_TOKEN must be set in the environment")
+            return 1
+        from src.actions import get_client
+        metadata = load_metadata(run_args, get_client(run_args), max_age=0)
+        if metadata is None:
+            logger.error("Could not fetch the project metadata")
+            return 1
+        logger.info(f"{len(metadata['types'])} Work Item Types, {len(metadata['areas'])} Area Paths and "
+                    f"{len(metadata['iterations'])} Iterations stored for completion and validation")
+        return
+
+    if run_args.get("list"):
+        prefix = (run_args.get("prefix") or "").lower()
+        words = []
+        for kind in run_args["list"].split(","):
+            if kind not in COMPLETION_KINDS:
+                logger.error(f"Unknown completion list {kind}. Use one of {', '.join(COMPLETION_KINDS)}")
+                return 1
+            words += [word for word in completion_words(run_args, kind) if word.lower().startswith(prefix)]
+        try:
+            for word in words:
+                print(word)
+            sys.stdout.flush()
+        except BrokenPipeError as ex:
+            from src.output import reader_gone
+            reader_gone(ex)
+        return
+
+    script = ZSH_COMPLETION if run_args.get("shell") == "zsh" else BASH_COMPLETION
+    print(script % {"commands": " ".join(run_args.get("commands") or [])}, end="")
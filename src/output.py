@@ -0,0 +1,59 @@
+import csv
+import json
+import logging
+import os
+import sys
+
+from src.projection import column_header, raw_value
+
+logger = logging.getLogger(__name__)
+
+
+def write_stream(chunks, columns: list, output_format: str, out=None) -> int:
+    """
+    Writes work items as they arrive - one chunk at a time - flushing after every chunk
+    Memory use is bounded by the chunk size regardless of how many work items are written
+    :param chunks: Iterable of lists of work items
+    :param columns: Column names from parse_columns
+    :param output_format: ndjson|csv|tsv
+    :return: Number of work items written
+    """
+    out = out or sys.stdout
+    headers = [column_header(col) for col in columns]
+    count = 0
+    try:
+        if output_format == "ndjson":
+            for chunk in chunks:
+                out.write("".join(json.dumps(dict(zip(headers, (raw_value(item, col) for col in columns)))) + "\n"
+                                  for item in chunk))
+                out.flush()
+                count += len(chunk)
+        else:
+            writer = csv.writer(out, delimiter="\t" if output_format == "tsv" else ",", lineterminator="\n")
+            writer.writerow(headers)
+            for chunk in chunks:
+                writer.writerows([raw_value(item, col) for col in columns] for item in chunk)
+                out.flush()
+                count += len(chunk)
+    except BrokenPipeError as ex:
+        reader_gone(ex)
+    finally:
+        # Stop a generator left part way here rather than in whichever thread collects it
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return count
+
+
+def reader_gone(ex: BrokenPipeError):
+    """
+    Handles the reader of stdout going away e.g. `ado list --format csv | head`
+    stdout is pointed at devnull to silence the final flush at exit. Inside `ado daemon` stdout is a FrameWriter
+    without a file descriptor, so the error is re-raised for the daemon to drop the client
+    """
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        # io.UnsupportedOperation is an OSError and ValueError
+        raise ex from None
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, fileno)
@@ -0,0 +1,164 @@
+import csv
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# A work item to create. parent_key references another node in the plan, parent_id an existing work item
+PlanNode = namedtuple("PlanNode", ["key", "level", "work_item_type", "title", "description", "parent_key",
+                                   "parent_id", "fields"])
+
+# Plan/csv keys -> work item field reference names
+FIELD_ALIASES = {
+    "areaPath": "System.AreaPath",
+    "iteration": "System.IterationPath",
+    "assignedTo": "System.AssignedTo",
+    "tags": "System.Tags",
+    "state": "System.State",
+    "acceptanceCriteria": "Microsoft.VSTS.Common.AcceptanceCriteria",
+}
+RESERVED_KEYS = {"key", "type", "title", "description", "desc", "parent", "children"}
+
+
+def _fields(entry: dict, defaults: dict) -> dict:
+    fields = {}
+    for key, value in {**defaults, **entry}.items():
+        if key in RESERVED_KEYS or value in (None, ""):
+            continue
+        fields[FIELD_ALIASES.get(key, key)] = value
+    return fields
+
+
+def _parent(value, keys):
+    """
+    :return: Tuple of (parent_key, parent_id) - a value matching a plan key wins over an existing work item id
+    """
+    if value in (None, ""):
+        return None, None
+    if str(value) in keys:
+        return str(value), None
+    try:
+        return None, int(value)
+    except ValueError:
+        raise ValueError(f"Parent {value} is neither a key in the plan nor a work item id")
+
+
+def load_yaml_plan(path: str, default_type: str = "Task") -> list:
+    """
+    Plan file format:
+
+        defaults: {areaPath: ..., iteration: ..., assignedTo: ...}
+        items:
+          - type: Epic
+            title: ...
+            parent: 1234  # optional existing work item
+            children:
+              - {type: Feature, title: ..., children: [...]}
+
+    Nodes without an explicit key are keyed by their position e.g. 1.2.1
+    :return: List of PlanNode
+    """
+    import yaml
+
+    with open(path) as f:
+        document = yaml.load(f.read(), Loader=yaml.SafeLoader) or {}
+    if isinstance(document, list):
+        document = {"items": document}
+    defaults = document.get("defaults") or {}
+
+    nodes = []
+    stack = [(entry, str(i + 1), None, 0) for i, entry in reversed(list(enumerate(document.get("items") or [])))]
+    while stack:
+        entry, position, parent_key, level = stack.pop()
+        if "title" not in entry:
+            raise ValueError(f"Plan item {position} has no title")
+        key = str(entry.get("key", position))
+        parent_id = None
+        if parent_key is None and entry.get("parent") is not None:
+            parent_id = int(entry["parent"])
+        nodes.append(PlanNode(key=key, level=level, work_item_type=entry.get("type", default_type),
+                              title=entry["title"], description=entry.get("description", entry.get("desc")) or "",
+                              parent_key=parent_key, parent_id=parent_id, fields=_fields(entry, defaults)))
+        children = entry.get("children") or []
+        stack.extend((child, f"{position}.{i + 1}", key, level + 1) for i, child in reversed(list(enumerate(children))))
+    return nodes
+
+
+def load_csv_plan(path: str, default_type: str = "Task") -> list:
+    """
+    Csv header: key,parent,type,title,description plus any FIELD_ALIASES or field reference names
+    parent is either the key of another row or an existing work item id
+    :return: List of PlanNode
+    """
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    keys = {row.get("key") or str(i + 1) for i, row in enumerate(rows)}
+
+    entries = {}
+    for i, row in enumerate(rows):
+        if not row.get("title"):
+            raise ValueError(f"Plan row {i + 1} has no title")
+        key = row.get("key") or str(i + 1)
+        parent_key, parent_id = _parent(row.get("parent"), keys)
+        entries[key] = (row, parent_key, parent_id)
+
+    def level(key):
+        depth, seen = 0, set()
+        while entries[key][1] is not None:
+            if key in seen:
+                raise ValueError(f"Plan row {key} is part of a parent cycle")
+            seen.add(key)
+            key = entries[key][1]
+            depth += 1
+        return depth
+
+    return [PlanNode(key=key, level=level(key), work_item_type=row.get("type") or default_type, title=row["title"],
+                     description=row.get("description") or row.get("desc") or "", parent_key=parent_key,
+                     parent_id=parent_id,
+                     fields=_fields(row, {}))
+            for key, (row, parent_key, parent_id) in entries.items()]
+
+
+def load_plan(path: str, default_type: str = "Task") -> list:
+    if path.lower().endswith(".csv"):
+        return load_csv_plan(path, default_type)
+    return load_yaml_plan(path, default_type)
+
+
+class PlanState:
+    """
+    Checkpoint of a bulk create stored next to the plan file
+    created maps node key -> work item id. pending holds the keys of a batch sent but not yet recorded
+    with the time it was sent, so a resumed run can look them up instead of creating duplicates
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.created = {}
+        self.pending = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.created = state.get("created", {})
+            self.pending = state.get("pending", {})
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": self.created, "pending": self.pending}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def mark_pending(self, keys: list):
+        # Back dated a minute to tolerate clock skew against the server when looking them up
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - 60))
+        self.pending.update({key: now for key in keys})
+        self.save()
+
+    def record(self, created: dict, failed: list = ()):
+        self.created.update(created)
+        for key in list(created) + list(failed):
+            self.pending.pop(key, None)
+        self.save()
@@ -0,0 +1,177 @@
+"""
+Phase and HTTP call tracing for `--profile`
+
+Spans are only recorded while a Tracer is active. With profiling off span() returns a shared no-op context manager
+and the HTTP hook in AdoClient.request is skipped, so the instrumentation costs a global lookup
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+SUMMARY = "summary"
+_NULL_SPAN = contextlib.nullcontext()
+_ID_PATTERN = re.compile(r"/\d+(?=/|$)")
+_tracer = None
+
+
+class Tracer:
+    """
+    Collects complete spans (Chrome trace "X" events) and instant events from any thread
+    """
+
+    def __init__(self, output: str, origin: float = None):
+        """
+        :param origin: time.perf_counter() of trace time 0. Defaults to now
+        """
+        self.output = output
+        self.origin = time.perf_counter() if origin is None else origin
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, category: str, start: float, end: float = None, **args):
+        """
+        :param start: time.perf_counter() the span started
+        :param end: time.perf_counter() the span ended. None records an instant event
+        """
+        event = {"name": name, "cat": category, "ph": "X" if end is not None else "i",
+                 "ts": (start - self.origin) * 1e6, "pid": os.getpid(), "tid": threading.get_native_id(),
+                 "args": args}
+        if end is not None:
+            event["dur"] = (end - start) * 1e6
+        else:
+            event["s"] = "t"
+        with self.lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, category, start, time.perf_counter(), **args)
+
+    def write_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        print(f"Trace of {len(self.events)} events written to {path} - open in https://ui.perfetto.dev",
+              file=sys.stderr)
+
+    def summary(self) -> str:
+        from tabulate import tabulate
+
+        phases = defaultdict(list)
+        calls = defaultdict(lambda: {"latency": [], "bytes": 0, "status": defaultdict(int), "retries": 0})
+        for event in self.events:
+            if event["cat"] == "http":
+                call = calls[f"{event['args']['method']} {event['args']['url']}"]
+                call["latency"].append(event["dur"] / 1000)
+                call["bytes"] += event["args"]["bytes"]
+                call["status"][event["args"]["status"]] += 1
+            elif event["cat"] == "retry":
+                calls[f"{event['args']['method']} {event['args']['url']}"]["retries"] += 1
+            elif event["ph"] == "X":
+                phases[event["name"]].append(event["dur"] / 1000)
+
+        phase_rows = [[name, len(durations), f"{sum(durations):.1f}", f"{max(durations):.1f}"]
+                      for name, durations in phases.items()]
+        call_rows = []
+        for template, call in sorted(calls.items(), key=lambda item: -sum(item[1]["latency"])):
+            latency = sorted(call["latency"]) or [0]
+            call_rows.append([template, len(call["latency"]),
+                              " ".join(f"{status}x{count}" for status, count in sorted(call["status"].items())),
+                              call["retries"], f"{call['bytes'] / 1024:.1f}", f"{sum(latency):.1f}",
+                              f"{latency[len(latency) // 2]:.1f}", f"{latency[-1]:.1f}"])
+        return "\n\n".join([
+            tabulate(phase_rows, headers=["Phase", "Count", "Total ms", "Max ms"]),
+            tabulate(call_rows, headers=["HTTP call", "Calls", "Status", "Retries", "KiB", "Total ms", "p50 ms",
+                                         "Max ms"]),
+        ])
+
+
+def start(output: str, origin: float = None):
+    """
+    Starts recording spans. output is "summary" (or `profile: true` in the config) for a table on stderr
+    or the path of a Chrome trace json file
+    """
+    global _tracer
+    _tracer = Tracer(output if isinstance(output, str) else SUMMARY, origin)
+    return _tracer
+
+
+def finish():
+    """
+    Stops recording and writes the summary table or trace file
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    if tracer.output == SUMMARY:
+        print(tracer.summary(), file=sys.stderr)
+    else:
+        tracer.write_trace(tracer.output)
+
+
+def active():
+    """
+    :return: The active Tracer or None when profiling is off
+    """
+    return _tracer
+
+
+def span(name: str, category: str = "phase", **args):
+    """
+    Context manager timing a phase - a no-op when profiling is off
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, **args)
+
+
+def traced(name: str):
+    """
+    Decorator timing every call of a function as a phase
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name, "phase"):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def url_template(path: str) -> str:
+    """
+    :return: The path with numeric ids replaced e.g. /org/project/_apis/wit/workitems/{id}/comments
+    """
+    return _ID_PATTERN.sub("/{id}", path.split("?", 1)[0])
+
+
+def process_started():
+    """
+    :return: time.perf_counter() value of the process start or None where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.perf_counter() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
@@ -0,0 +1,123 @@
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Column name shown in `ado list` -> field reference name requested from Azure DevOps
+COLUMN_FIELDS = {
+    "ID": "System.Id",
+    "Type": "System.WorkItemType",
+    "Title": "System.Title",
+    "Iteration": "System.IterationPath",
+    "State": "System.State",
+    "Tags": "System.Tags",
+    "Area": "System.AreaPath",
+    "AssignedTo": "System.AssignedTo",
+    "Parent": "System.Parent",
+    "Changed": "System.ChangedDate",
+}
+DEFAULT_COLUMNS = ["ID", "Type", "Title", "Iteration", "State"]
+# Columns filled in by the cli rather than requested from Azure DevOps. Project is the organization/project a
+# work item was listed from by `ado list --projects`
+COMPUTED_COLUMNS = {"Project"}
+# Columns prefixed with the hierarchy indent
+INDENTED_COLUMNS = {"ID", "Type", "Title"}
+# Always requested - colour depends on the type and the cache on the revision
+REQUIRED_FIELDS = ["System.Id", "System.WorkItemType", "System.Rev"]
+
+CARD_FIELDS = REQUIRED_FIELDS + [
+    "System.Title", "System.State", "System.AreaPath", "System.AssignedTo", "System.IterationPath",
+    "System.Description", "Microsoft.VSTS.Common.AcceptanceCriteria", "System.CommentCount",
+]
+
+# fields=None requests every field. The workitemsbatch api rejects `fields` combined with `$expand`
+# so relations can only be requested alongside all fields
+Projection = namedtuple("Projection", ["fields", "relations"])
+FULL_PROJECTION = Projection(fields=None, relations=True)
+
+
+def parse_columns(columns=None, tags: bool = False) -> list:
+    """
+    Resolves the --columns option into a list of column names
+    Accepts a comma separated string or list of names from COLUMN_FIELDS or raw field reference names
+    :param columns: e.g. "ID,Title,State" or "ID,Microsoft.VSTS.Scheduling.StoryPoints"
+    :param tags: Append the Tags column if not already present
+    :return: List of column names
+    """
+    if not columns:
+        columns = list(DEFAULT_COLUMNS)
+    elif isinstance(columns, str):
+        columns = [col.strip() for col in columns.split(",") if col.strip()]
+    else:
+        columns = list(columns)
+
+    for col in columns:
+        if col not in COLUMN_FIELDS and col not in COMPUTED_COLUMNS and "." not in col:
+            raise ValueError(f"Unknown column {col}. Use one of {', '.join([*COLUMN_FIELDS, *COMPUTED_COLUMNS])} "
+                             f"or a field reference name")
+
+    if tags and "Tags" not in columns:
+        columns.append("Tags")
+    return columns
+
+
+def column_field(column: str) -> str:
+    return COLUMN_FIELDS.get(column, column)
+
+
+def column_header(column: str) -> str:
+    return column if column in COLUMN_FIELDS or column in COMPUTED_COLUMNS else column.split(".")[-1]
+
+
+def project_fields(columns: list, hierarchy: bool = False) -> Projection:
+    """
+    Works out the minimal fields needed to render the columns
+    :param columns: Column names from parse_columns
+    :param hierarchy: Relations are needed to nest children under parents
+    :return: Projection to send to the workitemsbatch api
+    """
+    if hierarchy:
+        return FULL_PROJECTION
+    fields = list(REQUIRED_FIELDS)
+    for col in columns:
+        field = column_field(col)
+        if col not in COMPUTED_COLUMNS and field not in fields:
+            fields.append(field)
+    return Projection(fields=fields, relations=False)
+
+
+def covers(stored: Projection, needed: Projection) -> bool:
+    """
+    True if a payload fetched with the stored projection has everything the needed projection asks for
+    """
+    if needed.relations and not stored.relations:
+        return False
+    if stored.fields is None:
+        return True
+    return needed.fields is not None and set(needed.fields) <= set(stored.fields)
+
+
+def merge(first: Projection, second: Projection) -> Projection:
+    fields = None if first.fields is None or second.fields is None else sorted(set(first.fields) | set(second.fields))
+    return Projection(fields=fields, relations=first.relations or second.relations)
+
+
+def raw_value(work_item: dict, column: str):
+    """
+    :return: Json value of a column for a work item. Identity fields give the display name
+    """
+    if column == "ID":
+        return work_item["id"]
+    if column == "Project":
+        return work_item.get("project", "")
+    value = work_item["fields"].get(column_field(column), "")
+    if isinstance(value, dict):
+        value = value.get("displayName") or value.get("uniqueName", "")
+    return value
+
+
+def cell_value(work_item: dict, column: str) -> str:
+    """
+    :return: Display value of a column for a work item
+    """
+    return str(raw_value(work_item, column))
@@ -0,0 +1,231 @@
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from src.htmltext import html_to_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_INDEX_FILE = "~/.ado/search.db"
+DEFAULT_SEARCH_LIMIT = 50
+# Bump when the schema changes - older indexes are dropped and rebuilt by the next --update
+SCHEMA_VERSION = 1
+# Fields downloaded to index a work item
+INDEXED_FIELDS = [
+    "System.Id", "System.Rev", "System.WorkItemType", "System.Title", "System.State", "System.AssignedTo",
+    "System.AreaPath", "System.IterationPath", "System.Tags", "System.ChangedDate", "System.Description",
+    "Microsoft.VSTS.Common.AcceptanceCriteria",
+]
+# bm25 weights of the title, description, acceptance criteria and tags columns
+RANK_WEIGHTS = (10.0, 1.0, 1.0, 5.0)
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    organization TEXT NOT NULL,
+    project TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    rev INTEGER NOT NULL,
+    type TEXT,
+    title TEXT,
+    state TEXT,
+    assigned_to TEXT,
+    area_path TEXT,
+    iteration_path TEXT,
+    tags TEXT,
+    changed TEXT,
+    UNIQUE (organization, id)
+);
+CREATE INDEX IF NOT EXISTS items_changed ON items (changed);
+CREATE TABLE IF NOT EXISTS item_tags (
+    item INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS item_tags_tag ON item_tags (tag, item);
+CREATE INDEX IF NOT EXISTS item_tags_item ON item_tags (item);
+CREATE VIRTUAL TABLE IF NOT EXISTS item_text USING fts5(
+    title, description, criteria, tags, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS syncs (
+    scope TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def split_tags(tags: str) -> list:
+    """
+    :return: Lower cased tags of a System.Tags value e.g. "Backend; API" -> ["backend", "api"]
+    """
+    return [tag.strip().lower() for tag in (tags or "").split(";") if tag.strip()]
+
+
+def match_expression(text: str) -> str:
+    """
+    Turns free text into an FTS5 query matching every word - quoted so punctuation is never parsed as syntax
+    The last word also matches as a prefix e.g. "login time" finds "login timeout"
+    """
+    words = TOKEN_PATTERN.findall(text)
+    terms = [f'"{word}"' for word in words]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """
+    Local SQLite FTS5 index over work item titles, html stripped descriptions, acceptance criteria and tags
+    Searches run entirely offline. update_index downloads only the items changed since the last sync watermark
+    """
+
+    def __init__(self, path: str = DEFAULT_SEARCH_INDEX_FILE):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS items; DROP TABLE IF EXISTS item_tags; "
+                                    "DROP TABLE IF EXISTS item_text; DROP TABLE IF EXISTS syncs;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_sync(self, scope: str):
+        """
+        :return: Tuple of (watermark, synced_at) of the last update of an organization/project or None
+        """
+        return self.conn.execute("SELECT watermark, synced_at FROM syncs WHERE scope = ?", (scope,)).fetchone()
+
+    def set_sync(self, scope: str, watermark: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO syncs (scope, watermark, synced_at) VALUES (?, ?, ?)",
+                              (scope, watermark, time.time()))
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM items").fetchone()[0]
+
+    def put_work_items(self, organization: str, project: str, work_items: list) -> int:
+        """
+        Indexes work items fetched with INDEXED_FIELDS - items already indexed at the same or a later rev are skipped
+        :return: Number of work items (re)indexed
+        """
+        indexed = 0
+        with self.conn:
+            for item in work_items:
+                if item is None:
+                    continue
+                fields = item["fields"]
+                rev = item.get("rev", fields.get("System.Rev", 0))
+                row = self.conn.execute("SELECT rowid, rev FROM items WHERE organization = ? AND id = ?",
+                                        (organization, item["id"])).fetchone()
+                if row is not None and row[1] >= rev:
+                    continue
+                assigned_to = fields.get("System.AssignedTo") or ""
+                if isinstance(assigned_to, dict):
+                    assigned_to = assigned_to.get("uniqueName") or assigned_to.get("displayName", "")
+                values = (project, rev, fields.get("System.WorkItemType"), fields.get("System.Title", ""),
+                          fields.get("System.State"), assigned_to, fields.get("System.AreaPath"),
+                          fields.get("System.IterationPath"), fields.get("System.Tags", ""),
+                          fields.get("System.ChangedDate"))
+                if row is None:
+                    rowid = self.conn.execute(
+                        "INSERT INTO items (project, rev, type, title, state, assigned_to, area_path, iteration_path, "
+                        "tags, changed, organization, id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*values, organization, item["id"])).lastrowid
+                else:
+                    rowid = row[0]
+                    self.conn.execute(
+                        "UPDATE items SET project = ?, rev = ?, type = ?, title = ?, state = ?, assigned_to = ?, "
+                        "area_path = ?, iteration_path = ?, tags = ?, changed = ? WHERE rowid = ?", (*values, rowid))
+                    self.conn.execute("DELETE FROM item_text WHERE rowid = ?", (rowid,))
+                    self.conn.execute("DELETE FROM item_tags WHERE item = ?", (rowid,))
+                self.conn.execute(
+                    "INSERT INTO item_text (rowid, title, description, criteria, tags) VALUES (?, ?, ?, ?, ?)",
+                    (rowid, fields.get("System.Title", ""), html_to_text(fields.get("System.Description"), " "),
+                     html_to_text(fields.get("Microsoft.VSTS.Common.AcceptanceCriteria"), " "),
+                     fields.get("System.Tags", "")))
+                self.conn.executemany("INSERT INTO item_tags (item, tag) VALUES (?, ?)",
+                                      [(rowid, tag) for tag in split_tags(fields.get("System.Tags"))])
+                indexed += 1
+        return indexed
+
+    def search(self, text: str = None, tags: list = (), state: str = None, work_item_type: str = None,
+               area_path: str = None, organization: str = None, project: str = None,
+               limit: int = DEFAULT_SEARCH_LIMIT) -> list:
+        """
+        :param text: Free text - every word must match the title, description, acceptance criteria or tags
+        :param tags: Only items with every one of these tags
+        :param area_path: Only items in this area path or below it
+        :return: List of dicts with id, type, title, state, assigned_to, area_path, iteration_path, tags, changed
+        ordered by relevance - or most recently changed first without text
+        """
+        clauses, params = [], []
+        expression = match_expression(text or "")
+        if expression:
+            clauses.append("item_text MATCH ?")
+            params.append(expression)
+        for tag in tags:
+            clauses.append("items.rowid IN (SELECT item FROM item_tags WHERE tag = ?)")
+            params.append(tag.strip().lower())
+        for column, value in (("state", state), ("type", work_item_type), ("organization", organization),
+                              ("project", project)):
+            if value is not None:
+                clauses.append(f"items.{column} = ? COLLATE NOCASE")
+                params.append(value)
+        if area_path is not None:
+            clauses.append("(items.area_path = ? COLLATE NOCASE OR items.area_path LIKE ? ESCAPE '!')")
+            params += [area_path, area_path.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "\\%"]
+
+        columns = ("items.id, items.type, items.title, items.state, items.assigned_to, items.area_path, "
+                   "items.iteration_path, items.tags, items.changed")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        if expression:
+            weights = ", ".join(str(weight) for weight in RANK_WEIGHTS)
+            query = (f"SELECT {columns} FROM item_text JOIN items ON items.rowid = item_text.rowid {where} "
+                     f"ORDER BY bm25(item_text, {weights}) LIMIT ?")
+        else:
+            query = f"SELECT {columns} FROM items {where} ORDER BY changed DESC LIMIT ?"
+        rows = self.conn.execute(query, (*params, limit)).fetchall()
+        keys = ["id", "type", "title", "state", "assigned_to", "area_path", "iteration_path", "tags", "changed"]
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def update_index(index: SearchIndex, client, force: bool = False) -> int:
+    """
+    Brings the index of the clients organization/project up to date
+    Only work items changed since the previous update watermark are queried and downloaded - every state and user
+    The watermark only advances once every chunk was downloaded so failed items are queried again next update
+    :param force: Ignore the watermark and re-download every work item
+    :return: Number of work items (re)indexed
+    """
+    from itertools import chain
+    from src.azureapi import FailedChunk
+
+    scope = f"{client.organization}/{client.project_name}"
+    sync = None if force else index.get_sync(scope)
+    query = "Select [System.Id] From WorkItems Where [System.TeamProject] = @project"
+    if sync is not None:
+        query += f" AND [System.ChangedDate] > '{sync[0]}'"
+    as_of, windows = client.query_ids({"query": query})
+    indexed = failed = 0
+    for chunk in client.iter_work_items_batch(source_ids=chain.from_iterable(windows), fields=INDEXED_FIELDS):
+        if isinstance(chunk, FailedChunk):
+            failed += len(chunk.ids)
+        indexed += index.put_work_items(client.organization, client.project_name, chunk)
+    if failed:
+        logger.warning(f"{failed} work items could not be downloaded - they are retried by the next update")
+        return indexed
+    index.set_sync(scope, as_of or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    logger.debug(f"Search index {index.path} updated - {indexed} work items indexed from {scope}")
+    return indexed
+
+
+def open_search_index(run_args) -> SearchIndex:
+    """
+    :return: SearchIndex at the configured searchIndexFile
+    """
+    return SearchIndex(run_args.get("searchIndexFile") or DEFAULT_SEARCH_INDEX_FILE)
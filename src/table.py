@@ -0,0 +1,134 @@
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Above this many rows `ado list` skips tabulate and renders with fast_table
+DEFAULT_FAST_TABLE_ROWS = 500
+MIN_TRUNCATED_WIDTH = 10
+ELLIPSIS = "…"
+COLUMN_SEPARATOR = "  "
+RESET = "\033[0m"
+
+
+def display_width(text: str) -> int:
+    """
+    :return: Terminal columns text occupies - wide east asian characters take two and combining marks none
+    """
+    if text.isascii():
+        return len(text)
+    return sum(0 if unicodedata.combining(ch) else 2 if unicodedata.east_asian_width(ch) in "WF" else 1
+               for ch in text)
+
+
+def truncate(text: str, width: int) -> str:
+    if display_width(text) <= width:
+        return text
+    if text.isascii():
+        return text[:width - 1] + ELLIPSIS
+    while display_width(text) > width - 1:
+        text = text[:-1]
+    return text + ELLIPSIS
+
+
+def is_number(text: str) -> bool:
+    return text.lstrip("-").isdigit()
+
+
+def terminal_size():
+    """
+    :return: os.terminal_size of the terminal stdout writes to or None when it is not a terminal
+    `ado daemon` sets terminal_size on its stdout to the clients terminal
+    """
+    forwarded = getattr(sys.stdout, "terminal_size", None)
+    if forwarded is not None or not hasattr(sys.stdout, "fileno"):
+        return forwarded
+    try:
+        if not os.isatty(sys.stdout.fileno()):
+            return None
+    except (OSError, ValueError):
+        return None
+    return shutil.get_terminal_size()
+
+
+def fit_column(rows: list, headers: list, column: int, max_width: int, separator: int = len(COLUMN_SEPARATOR)):
+    """
+    Truncates the values of one column (in place) so every row fits in max_width terminal columns
+    """
+    widths = [display_width(header) for header in headers]
+    for row in rows:
+        for i, value in enumerate(row):
+            width = display_width(value)
+            if width > widths[i]:
+                widths[i] = width
+    available = max_width - (sum(widths) - widths[column]) - separator * (len(headers) - 1)
+    if widths[column] <= available:
+        return
+    available = max(available, MIN_TRUNCATED_WIDTH)
+    for row in rows:
+        row[column] = truncate(row[column], available)
+
+
+def fast_table(rows: list, headers: list, row_colors: list = None) -> list:
+    """
+    Renders rows of strings in tabulate's "simple" format
+    Column widths and alignment come from one pass over the raw values and colour is applied once per row
+    :param row_colors: Optional ANSI colour code per row
+    :return: List of lines
+    """
+    widths = [display_width(header) for header in headers]
+    numeric = [True] * len(headers)
+    for row in rows:
+        for i, value in enumerate(row):
+            width = display_width(value)
+            if width > widths[i]:
+                widths[i] = width
+            if numeric[i] and not is_number(value):
+                numeric[i] = False
+
+    def line(values):
+        cells = []
+        for i, value in enumerate(values):
+            padding = " " * (widths[i] - display_width(value))
+            cells.append(padding + value if numeric[i] else value + padding)
+        return COLUMN_SEPARATOR.join(cells).rstrip()
+
+    lines = [line(headers), COLUMN_SEPARATOR.join("-" * width for width in widths)]
+    if row_colors is None:
+        lines += [line(row) for row in rows]
+    else:
+        lines += [f"{row_color}{line(row)}{RESET}" for row, row_color in zip(rows, row_colors)]
+    return lines
+
+
+def page(text: str, run_args):
+    """
+    Prints text - through $PAGER (default `less -FRX`) when stdout is a terminal the text does not fit in
+    """
+    size = terminal_size()
+    # `ado daemon` cannot start a pager in the clients terminal
+    forwarded = getattr(sys.stdout, "terminal_size", None) is not None
+    pager = os.environ.get("PAGER") or ("less" if shutil.which("less") else None)
+    if not run_args.get("pager", True) or size is None or forwarded or not pager or text.count("\n") < size.lines:
+        print(text)
+        return
+    # Like git - keep colours and quit immediately when the output fits after all
+    env = {**os.environ, "LESS": os.environ.get("LESS", "FRX")}
+    try:
+        proc = subprocess.Popen(pager, shell=True, stdin=subprocess.PIPE, env=env, encoding="utf-8",
+                                errors="replace")
+    except OSError as ex:
+        logger.debug(f"Pager {pager} unavailable: {ex}")
+        print(text)
+        return
+    try:
+        proc.stdin.write(text + "\n")
+        proc.stdin.close()
+    except BrokenPipeError:
+        # Pager quit before reading everything
+        pass
+    proc.wait()
@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Requests per second pacing starts from when the server first signals pressure on an unlimited scheduler.
+# Once the rate recovers to it the scheduler stops pacing again
+PRESSURE_REQUEST_RATE = 50.0
+MIN_REQUEST_RATE = 1.0
+# Added to the rate after every response without a throttling signal
+RATE_RECOVERY_STEP = 1.0
+# Multiplier applied to the rate on a 429 and on a delayed or nearly exhausted response
+THROTTLED_RATE_FACTOR = 0.5
+DELAYED_RATE_FACTOR = 0.8
+# X-RateLimit-Remaining below this share of X-RateLimit-Limit slows the client down before it is throttled
+LOW_BUDGET_SHARE = 0.1
+# Pause after a 429 without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 300.0
+RETRY_BACKOFF = 0.5
+# (base_url, organization) -> RequestScheduler shared by every AdoClient of that organization
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def header_seconds(headers, name: str):
+    """
+    :return: A header in seconds - numeric or an HTTP date for Retry-After - or None when missing or invalid
+    """
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """
+    :return: Full jitter exponential backoff in seconds so concurrent retries do not arrive together
+    """
+    return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+
+class RequestScheduler:
+    """
+    Paces every request to an organization through a token bucket once Azure DevOps signals pressure
+    Requests go out unpaced - or at max_rate when one is configured - until a 429, an X-RateLimit-Delay, a Retry-After
+    or a low X-RateLimit-Remaining arrives. The rate is then cut and recovers a step per clean response, back to
+    unpaced once it reaches PRESSURE_REQUEST_RATE. The bucket refills at `rate` requests per second.
+    A 429 also pauses every new send until its Retry-After has passed, so queued work waits rather than failing
+    """
+
+    def __init__(self, max_rate: float = None, min_rate: float = MIN_REQUEST_RATE):
+        """
+        :param max_rate: Requests per second never exceeded. None leaves the client unpaced until it is throttled
+        """
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate) if max_rate else min_rate
+        # None while unpaced
+        self.rate = max_rate
+        self.tokens = max_rate or 0.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.ceiling, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    @property
+    def ceiling(self) -> float:
+        """
+        Rate the bucket recovers to - and its burst size
+        """
+        return self.max_rate or PRESSURE_REQUEST_RATE
+
+    def slow_down(self, factor: float):
+        """
+        Cuts the rate - starting to pace from the ceiling when unpaced
+        Called with the lock held
+        """
+        if self.rate is None:
+            self.tokens, self.updated = 0.0, time.monotonic()
+        self.rate = max(self.min_rate, (self.rate or self.ceiling) * factor)
+
+    def observe(self, response):
+        """
+        Adjusts the rate from the rate limit headers of a response
+        A 429 pauses every sender for its Retry-After
+        """
+        headers = response.headers
+        retry_after = header_seconds(headers, "Retry-After")
+        delay = header_seconds(headers, "X-RateLimit-Delay")
+        remaining = header_seconds(headers, "X-RateLimit-Remaining")
+        limit = header_seconds(headers, "X-RateLimit-Limit")
+        low_budget = remaining is not None and limit and remaining < limit * LOW_BUDGET_SHARE
+
+        with self.lock:
+            if response.status_code == 429:
+                self.throttled += 1
+                pause = min(retry_after if retry_after is not None else DEFAULT_RETRY_AFTER, MAX_RETRY_AFTER)
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                self.slow_down(THROTTLED_RATE_FACTOR)
+                self.tokens = 0
+                logger.debug(f"Throttled (429) - pausing {pause:.1f}s at {self.rate:.1f} requests/s. "
+                             f"{self.throttled} throttled, {self.retries} retries so far")
+                return
+            if delay or retry_after or low_budget:
+                self.slow_down(DELAYED_RATE_FACTOR)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + min(retry_after, MAX_RETRY_AFTER))
+                logger.debug(f"Rate limit pressure (delay {delay}, remaining {remaining}/{limit}, retry after "
+                             f"{retry_after}) - slowing to {self.rate:.1f} requests/s")
+            elif self.rate is not None and self.rate < self.ceiling:
+                self.rate += RATE_RECOVERY_STEP
+                if self.rate >= self.ceiling:
+                    # Back to the configured max_rate - or unpaced without one
+                    self.rate = self.max_rate
+                    logger.debug("Rate limit pressure cleared")
+
+    def retrying(self, reason) -> int:
+        """
+        Counts a retry
+        :return: Total retries so far
+        """
+        with self.lock:
+            self.retries += 1
+            retries = self.retries
+        logger.debug(f"Retrying after {reason}. {self.throttled} throttled, {retries} retries so far")
+        return retries
+
+
+def get_scheduler(base_url: str, organization: str, max_rate: float = None) -> RequestScheduler:
+    """
+    :param max_rate: Opt-in requests per second ceiling. Unpaced until throttled when None
+    :return: The RequestScheduler of an organization - created on first use
+    """
+    key = (base_url, organization)
+    with _SCHEDULERS_LOCK:
+        if key not in _SCHEDULERS:
+            _SCHEDULERS[key] = RequestScheduler(float(max_rate) if max_rate else None)
+        return _SCHEDULERS[key]